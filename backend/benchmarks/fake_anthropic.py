@@ -0,0 +1,104 @@
+"""Local stand-in for the Anthropic Messages API, for running and timing prompt jobs offline.
+
+    cd backend && python -m benchmarks.fake_anthropic [--port 8090] [--latency 1.5] [--error-rate 0.05]
+    ANTHROPIC_API_KEY=fake python prompt_batch.py run weekly --base-url http://127.0.0.1:8090
+
+POST /v1/messages answers after `latency` seconds (plus up to 50% jitter) with a canned prompt
+object in the format SYSTEM_PROMPT asks for, or with an overloaded error at `error-rate`.
+Streaming requests get the same reply as server-sent events. GET /stats reports request counts
+and peak concurrency.
+"""
+import argparse
+import asyncio
+import json
+import random
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+config = {"latency": 1.5, "error_rate": 0.0}
+stats = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+
+REPLY = {
+    "suno_prompt": "dreamy indie pop, shimmering guitars, soft female vocals, 100 bpm, nostalgic",
+    "lyria_prompt": "Warm, hazy indie pop built on chorus-drenched guitars and a steady mid-tempo beat.",
+    "song_concept": "A late-summer drive remembered years later",
+    "mood": "nostalgic",
+    "tempo_feel": "midtempo",
+    "energy_estimate": 0.55,
+    "valence_estimate": 0.6,
+}
+
+
+def _usage(body: dict) -> dict:
+    prompt_chars = len(json.dumps(body.get("system", ""))) + len(json.dumps(body.get("messages", [])))
+    return {"input_tokens": prompt_chars // 4, "output_tokens": len(json.dumps(REPLY)) // 4,
+            "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream(message: dict, text: str):
+    start = {**message, "content": [], "stop_reason": None}
+    yield _sse("message_start", {"type": "message_start", "message": start})
+    yield _sse("content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+    for i in range(0, len(text), 16):
+        yield _sse("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text[i : i + 16]}})
+    yield _sse("content_block_stop", {"type": "content_block_stop", "index": 0})
+    yield _sse("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                 "usage": {"output_tokens": message["usage"]["output_tokens"]}})
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def messages(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+    try:
+        await asyncio.sleep(config["latency"] * random.uniform(1.0, 1.5))
+    finally:
+        stats["in_flight"] -= 1
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}, status_code=529)
+
+    text = json.dumps(REPLY, indent=2)
+    message = {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "fake"),
+        "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": _usage(body),
+    }
+    if body.get("stream"):
+        return StreamingResponse(_stream(message, text), media_type="text/event-stream")
+    return message
+
+
+@app.get("/stats")
+def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=1.5, help="base seconds per response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 529")
+    args = parser.parse_args()
+    config.update(latency=args.latency, error_rate=args.error_rate)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
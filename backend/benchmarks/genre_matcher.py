@@ -0,0 +1,77 @@
+"""Compare GenreMatcher with the old linear substring scan, and list genres that cluster differently.
+
+    cd backend && python -m benchmarks.genre_matcher
+"""
+import itertools
+import time
+
+from services.analyzer import GENRE_CLUSTER_MAP, GenreMatcher
+
+BASE_GENRES = [
+    "pop", "dance pop", "k-pop", "j-pop", "indie pop", "art pop", "synth-pop", "synthpop", "electropop", "hyperpop", "bedroom pop",
+    "rock", "indie rock", "alt-rock", "alternative rock", "classic rock", "garage rock", "post-punk", "postpunk",
+    "pop punk", "skate punk", "emo", "shoegaze", "dream pop", "grunge", "metal", "metalcore", "deathcore", "nu metal",
+    "hip hop", "rap", "trap", "drill", "boom bap", "conscious hip hop", "gangster rap", "cloud rap",
+    "r&b", "alternative r&b", "neo soul", "soul", "funk", "disco", "jazz", "smooth jazz", "jazz rap",
+    "edm", "house", "deep house", "tech house", "techno", "minimal techno", "ambient", "electronica",
+    "drum and bass", "dubstep", "uk garage", "trance", "lo-fi beats", "chillhop", "downtempo",
+    "country", "country pop", "folk", "indie folk", "americana", "bluegrass", "singer-songwriter",
+    "latin", "latin pop", "reggaeton", "trap latino", "bachata", "salsa", "cumbia", "afrobeats",
+    "classical", "modern classical", "neoclassical", "soundtrack", "video game music", "salt lake city indie", "basalt",
+]
+SCENES = [
+    "", "uk", "german", "swedish", "brooklyn", "atlanta", "chicago", "canadian", "australian", "french",
+    "japanese", "korean", "brazilian", "mexican", "modern", "vintage", "experimental", "underground",
+    "christian", "deep", "nz", "dutch", "irish", "scottish", "nashville", "melodic", "dark", "vapor",
+    "acoustic", "instrumental", "italian", "spanish", "polish", "finnish", "norwegian", "danish", "toronto",
+    "texas", "la", "nyc", "bay area",
+]
+
+
+def legacy_cluster_genre(genre: str) -> str | None:
+    genre_lower = genre.lower()
+    for key, cluster in GENRE_CLUSTER_MAP.items():
+        if key in genre_lower:
+            return cluster
+    return None
+
+
+def vocabulary() -> list[str]:
+    return [f"{scene} {base}".strip() for scene, base in itertools.product(SCENES, BASE_GENRES)]
+
+
+def timed(fn, genres: list[str], rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for genre in genres:
+            fn(genre)
+    return (time.perf_counter() - started) / (rounds * len(genres)) * 1e9
+
+
+def main():
+    genres = vocabulary()
+    rounds = 20
+    matcher = GenreMatcher(GENRE_CLUSTER_MAP)
+    uncached = GenreMatcher(GENRE_CLUSTER_MAP, memo_size=0)
+
+    legacy_ns = timed(legacy_cluster_genre, genres, rounds)
+    scan_ns = timed(lambda genre: uncached._scan(genre.lower()), genres, rounds)
+    matcher.match("warm-up")
+    timed(matcher.match, genres, 1)
+    memo_ns = timed(matcher.match, genres, rounds)
+
+    print(f"vocabulary: {len(genres)} genre strings, {len(GENRE_CLUSTER_MAP)} cluster keys")
+    print(f"legacy linear scan : {legacy_ns:8.0f} ns/genre")
+    print(f"matcher, cold      : {scan_ns:8.0f} ns/genre")
+    print(f"matcher, memoised  : {memo_ns:8.0f} ns/genre")
+
+    changed = [g for g in genres if legacy_cluster_genre(g) != matcher.match(g)]
+    print(f"\n{len(changed)} genres cluster differently; base genres affected:")
+    for genre in BASE_GENRES:
+        old, new = legacy_cluster_genre(genre), matcher.match(genre)
+        if old != new:
+            print(f"  {genre!r:20} {old!s:>12} -> {new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Check build_taste_profiles against build_taste_profile and time both.
+
+    cd backend && python -m benchmarks.taste_profile [users] [tracks_per_source]
+"""
+import contextlib
+import io
+import random
+import sys
+import time
+
+from services.analyzer import ARTIST_SOURCE_WEIGHTS, WEIGHTS, build_taste_profile
+from services.analyzer_batch import build_taste_profiles
+from benchmarks.genre_matcher import vocabulary
+
+
+def synthetic_user(rng: random.Random, genres: list[str], tracks_per_source: int) -> dict:
+    favourites = rng.sample(genres, 40)
+
+    def track(i: int) -> dict:
+        return {
+            "name": f"Track {i}",
+            "artists": [f"Artist {rng.randrange(500)}"],
+            "release_date": rng.choice(["", "0000", f"{rng.randint(1940, 2025)}-01-01", str(rng.randint(1960, 2025))]),
+            "popularity": rng.choice([0, None, rng.randint(1, 100), rng.randint(1, 100) + 0.5]),
+            "explicit": rng.random() < 0.3,
+            "genres": rng.sample(favourites, rng.randint(0, 4)),
+        }
+
+    data = {source: [track(i) for i in range(rng.randint(0, tracks_per_source))] for source in WEIGHTS}
+    for source in ARTIST_SOURCE_WEIGHTS:
+        data[source] = [
+            {"name": f"Artist {rng.randrange(500)}", "genres": rng.sample(favourites, rng.randint(0, 3)), "popularity": rng.randint(0, 100)}
+            for _ in range(rng.randint(0, 50))
+        ]
+    return data
+
+
+def main():
+    n_users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    tracks_per_source = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rng = random.Random(7)
+    genres = vocabulary()
+    batch = [synthetic_user(rng, genres, tracks_per_source) for _ in range(n_users)]
+    batch += [{}, {"top_short": [{"name": "x", "artists": [], "genres": []}]}]
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        expected = [build_taste_profile(data) for data in batch]
+    per_user = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = build_taste_profiles(batch)
+    columnar = time.perf_counter() - started
+
+    mismatches = [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+    tracks = sum(p.track_count for p in expected)
+    print(f"{len(batch)} users, {tracks} tracks")
+    print(f"build_taste_profile loop : {per_user * 1000:8.1f} ms")
+    print(f"build_taste_profiles     : {columnar * 1000:8.1f} ms")
+    print(f"mismatching profiles     : {len(mismatches)}")
+    for i in mismatches[:3]:
+        print(f"  user {i}:\n    expected {expected[i]}\n    actual   {actual[i]}")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compare retained memory per track for the legacy meta dicts and the Library-based fetch paths.
+
+The production profile build keeps the Library and reads it with TasteState.from_library;
+fetch_all_data additionally expands it back into per-track dicts with copied genre lists.
+
+    cd backend && python -m benchmarks.track_memory [tracks] [artists]
+"""
+import gc
+import random
+import sys
+import tracemalloc
+
+from services.analyzer import TasteState
+from services.records import Library
+from services.spotify import SpotifyClient
+from benchmarks.genre_matcher import vocabulary
+
+
+def synthetic_payloads(rng: random.Random, n_tracks: int, n_artists: int) -> tuple[list[dict], list[dict]]:
+    """Raw Spotify track and artist objects with the fields the API returns that matter here."""
+    genres = vocabulary()
+    artists = [
+        {
+            "id": f"{i:022d}",
+            "name": f"Artist {i}",
+            "genres": rng.sample(genres, rng.randint(0, 6)),
+            "popularity": rng.randint(0, 100),
+            "followers": {"href": None, "total": rng.randint(0, 10**6)},
+            "images": [{"url": f"https://i.scdn.co/image/{i:040d}", "height": h, "width": h} for h in (640, 320, 160)],
+            "external_urls": {"spotify": f"https://open.spotify.com/artist/{i:022d}"},
+            "uri": f"spotify:artist:{i:022d}",
+            "type": "artist",
+        }
+        for i in range(n_artists)
+    ]
+    tracks = []
+    for i in range(n_tracks):
+        credited = rng.sample(artists, rng.choice([1, 1, 1, 2, 3]))
+        tracks.append({
+            "name": f"Track {i}",
+            "artists": [{"id": a["id"], "name": a["name"]} for a in credited],
+            "album": {"name": f"Album {i // 10}", "release_date": f"{rng.randint(1960, 2025)}-01-01"},
+            "popularity": rng.randint(0, 100),
+            "duration_ms": rng.randint(90_000, 400_000),
+            "explicit": rng.random() < 0.3,
+        })
+    return tracks, artists
+
+
+def legacy(tracks: list[dict], artists: list[dict]):
+    """What fetch_all_data used to keep: meta dicts with copied genre lists plus the artist payload map."""
+    extract = SpotifyClient("").extract_track_meta
+    artist_map = {a["id"]: dict(a, genres=list(a["genres"])) for a in artists}
+    metas = []
+    for track in tracks:
+        meta = extract(track)
+        meta["genres"] = [g for aid in meta["artist_ids"] for g in artist_map[aid].get("genres", [])]
+        metas.append(meta)
+    return metas, artist_map
+
+
+def compact(tracks: list[dict], artists: list[dict]) -> Library:
+    library = Library()
+    library.tracks["saved_tracks"] = [library.track_record(t) for t in tracks]
+    for artist in artists:
+        library.update_artist(artist)
+    return library
+
+
+def library_dicts(tracks: list[dict], artists: list[dict]):
+    """What fetch_all_data returns on top of the Library it builds."""
+    library = compact(tracks, artists)
+    return library, library.to_data()
+
+
+def library_state(tracks: list[dict], artists: list[dict]):
+    """What a profile build holds: the Library and the TasteState read straight from it."""
+    library = compact(tracks, artists)
+    return library, TasteState.from_library(library)
+
+
+def retained_bytes(build, tracks: list[dict], artists: list[dict]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = build(tracks, artists)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def main():
+    n_tracks = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    n_artists = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    tracks, artists = synthetic_payloads(random.Random(11), n_tracks, n_artists)
+
+    # Strings from the payloads are shared by all layouts, so only the structures built on top count.
+    before = retained_bytes(legacy, tracks, artists)
+    print(f"{n_tracks} tracks, {n_artists} artists")
+    print(f"legacy enriched meta dicts           : {before / n_tracks:8.0f} bytes/track")
+    for label, build in (
+        ("Library + to_data() (fetch_all_data)", library_dicts),
+        ("Library + TasteState (profile build)", library_state),
+    ):
+        after = retained_bytes(build, tracks, artists)
+        print(f"{label:37}: {after / n_tracks:8.0f} bytes/track ({after / before:.2f}x legacy)")
+
+if __name__ == "__main__":
+    main()
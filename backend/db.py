@@ -2,6 +2,7 @@ import os
 from datetime import datetime, timezone
 from typing import Optional
 
+from sqlalchemy import inspect, text
 from sqlmodel import Field, SQLModel, Session, create_engine
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./reso.db")
@@ -9,6 +10,9 @@ if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
 connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+# Services open a Session around their DB reads and writes only, never across an await on the
+# network: each open session pins a pooled connection, and once the pool is exhausted checkout
+# blocks the event loop, so the coroutines holding connections can never finish.
 engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
 
 
@@ -20,6 +24,8 @@ class User(SQLModel, table=True):
     token_expiry: datetime
     profile_cache: Optional[str] = None
     profile_cache_at: Optional[datetime] = None
+    profile_state: Optional[str] = None
+    last_seen_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -37,8 +43,96 @@ class GeneratedTrack(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class ListeningEvent(SQLModel, table=True):
+    user_id: str = Field(foreign_key="user.id", primary_key=True)
+    played_at: datetime = Field(primary_key=True)
+    track_id: str
+    track_json: str
+
+
+class CachedArtist(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    name: str
+    genres: str = "[]"
+    popularity: int = 0
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class CachedGenreLookup(SQLModel, table=True):
+    name_key: str = Field(primary_key=True)
+    genres: str = "[]"
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ProfileBuildLock(SQLModel, table=True):
+    user_id: str = Field(primary_key=True)
+    owner: str
+    expires_at: datetime
+
+
+class PromptJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    campaign: str = Field(index=True)
+    user_id: str = Field(foreign_key="user.id")
+    novelty_level: float
+    profile_hash: str
+    status: str = "pending"
+    attempts: int = 0
+    last_error: Optional[str] = None
+    result: Optional[str] = None
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class GenerationJob(SQLModel, table=True):
+    id: str = Field(primary_key=True)
+    user_id: str = Field(foreign_key="user.id", index=True)
+    platform: str
+    novelty_level: float
+    custom_prompt_override: Optional[str] = None
+    status: str = Field(default="queued", index=True)
+    prompts: Optional[str] = None
+    tags: Optional[str] = None
+    suno_id: Optional[str] = None
+    suno_submitted_at: Optional[datetime] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    owner: Optional[str] = None
+    heartbeat_at: Optional[datetime] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class GenerationEvent(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(foreign_key="generationjob.id", index=True)
+    event: str
+    data: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def _add_missing_columns():
+    """create_all only creates missing tables, so add nullable columns introduced since a table was created."""
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column.type.compile(engine.dialect)}"
+                ))
+                print(f"[db] added column {table.name}.{column.name}", flush=True)
+
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    _add_missing_columns()
 
 
 def get_session():
@@ -12,6 +12,15 @@ from fastapi.middleware.cors import CORSMiddleware
 
 from db import create_db_and_tables
 from routers import auth, captcha, feedback, generate, profile
+from services.captcha_watcher import captcha_watcher
+from services.generation_jobs import generation_workers
+from services.http_clients import close_clients, pool_stats, start_clients
+from services.profiles import cache_stats as profile_cache_stats
+from services.prompt_builder import close_anthropic_client, get_anthropic_client, usage_stats as anthropic_usage_stats
+from services.prompt_pool import pool_stats as prompt_pool_stats
+from services.spotify import governor as spotify_governor
+from services.suno import poller as suno_poller
+from services.token_refresh import token_refresher
 
 app = FastAPI(title="Reso", version="0.1.0")
 
@@ -39,10 +48,69 @@ app.include_router(captcha.router, prefix="/api", tags=["captcha"])
 
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     create_db_and_tables()
+    await start_clients()
+    get_anthropic_client()
+    token_refresher.start()
+    generation_workers.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await generation_workers.stop()
+    await captcha_watcher.stop()
+    await token_refresher.stop()
+    await suno_poller.stop()
+    await close_anthropic_client()
+    await close_clients()
 
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
+
+
+@app.get("/health/http")
+def health_http():
+    return pool_stats()
+
+
+@app.get("/health/spotify")
+def health_spotify():
+    return spotify_governor.snapshot()
+
+
+@app.get("/health/tokens")
+def health_tokens():
+    return token_refresher.snapshot()
+
+
+@app.get("/health/generation")
+def health_generation():
+    return generation_workers.snapshot()
+
+
+@app.get("/health/captcha")
+def health_captcha():
+    return captcha_watcher.snapshot()
+
+
+@app.get("/health/suno")
+def health_suno():
+    return suno_poller.snapshot()
+
+
+@app.get("/health/profiles")
+def health_profiles():
+    return profile_cache_stats()
+
+
+@app.get("/health/anthropic")
+def health_anthropic():
+    return anthropic_usage_stats
+
+
+@app.get("/health/prompt-pool")
+def health_prompt_pool():
+    return prompt_pool_stats()
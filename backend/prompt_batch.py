@@ -0,0 +1,171 @@
+"""Generate prompts for many users ahead of time, e.g. for a weekly campaign.
+
+    cd backend && python prompt_batch.py enqueue weekly-2026-42 [--novelty 0.3] [--active-days 30]
+    cd backend && python prompt_batch.py run weekly-2026-42 [--concurrency 16] [--max-attempts 3]
+    cd backend && python prompt_batch.py status weekly-2026-42
+
+Jobs live in the PromptJob table, one per user and campaign, and are built from the cached
+TasteProfile in User.profile_cache. Failed jobs are retried with exponential backoff until
+--max-attempts, so `run` can be re-run after a crash and only picks up unfinished work.
+ANTHROPIC_BASE_URL (or --base-url) points the job at another endpoint, such as the fake server
+in benchmarks/fake_anthropic.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlmodel import Session, func, select
+
+from db import PromptJob, User, create_db_and_tables, engine
+from services.analyzer import TasteProfile
+from services.prompt_builder import close_anthropic_client, generate_prompts, usage_stats
+from services.prompt_pool import profile_hash
+
+RETRY_BACKOFF = timedelta(seconds=5)
+
+
+def enqueue(campaign: str, novelty_level: float, active_days: int) -> int:
+    """Add a pending job for every user with a recent cached profile and no job in this campaign yet."""
+    since = datetime.utcnow() - timedelta(days=active_days)
+    with Session(engine) as session:
+        existing = set(session.exec(select(PromptJob.user_id).where(PromptJob.campaign == campaign)).all())
+        users = session.exec(select(User).where(User.profile_cache.is_not(None), User.profile_cache_at >= since)).all()
+        added = 0
+        for user in users:
+            if user.id in existing:
+                continue
+            profile = TasteProfile(**json.loads(user.profile_cache))
+            session.add(PromptJob(
+                id=str(uuid.uuid4()),
+                campaign=campaign,
+                user_id=user.id,
+                novelty_level=novelty_level,
+                profile_hash=profile_hash(profile),
+            ))
+            added += 1
+        session.commit()
+    return added
+
+
+async def process(job_id: str, max_attempts: int) -> str:
+    with Session(engine) as session:
+        job = session.get(PromptJob, job_id)
+        user = session.get(User, job.user_id)
+        novelty_level = job.novelty_level
+        profile_json = user.profile_cache if user else None
+
+    result = error = None
+    try:
+        if not profile_json:
+            raise LookupError("user has no cached profile")
+        profile = TasteProfile(**json.loads(profile_json))
+        result = await generate_prompts(profile, novelty_level)
+    except Exception as exc:
+        error = repr(exc)[:500]
+
+    with Session(engine) as session:
+        job = session.get(PromptJob, job_id)
+        if error is None:
+            job.result = json.dumps(result)
+            job.profile_hash = profile_hash(profile)
+            job.status = "done"
+            job.last_error = None
+        else:
+            job.attempts += 1
+            job.last_error = error
+            job.status = "failed" if job.attempts >= max_attempts else "pending"
+            job.next_attempt_at = datetime.utcnow() + RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+        return job.status
+
+
+async def run(campaign: str, concurrency: int, max_attempts: int) -> Counter:
+    """Work through the campaign's pending jobs until none are left, waiting out retry backoff."""
+    semaphore = asyncio.Semaphore(concurrency)
+    results: Counter = Counter()
+
+    async def one(job_id: str):
+        async with semaphore:
+            results[await process(job_id, max_attempts)] += 1
+
+    while True:
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            pending = (PromptJob.campaign == campaign, PromptJob.status == "pending")
+            due = session.exec(select(PromptJob.id).where(*pending, PromptJob.next_attempt_at <= now)).all()
+            next_at = session.exec(select(func.min(PromptJob.next_attempt_at)).where(*pending)).one()
+        if due:
+            await asyncio.gather(*(one(job_id) for job_id in due))
+        elif next_at is None:
+            return results
+        else:
+            await asyncio.sleep(max((next_at - now).total_seconds(), 0.0))
+
+
+def status(campaign: str) -> dict:
+    with Session(engine) as session:
+        rows = session.exec(
+            select(PromptJob.status, func.count()).where(PromptJob.campaign == campaign).group_by(PromptJob.status)
+        ).all()
+    return dict(rows)
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Bulk prompt generation for campaigns")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("enqueue", help="create jobs for users with a recent cached profile")
+    add.add_argument("campaign")
+    add.add_argument("--novelty", type=float, default=0.2)
+    add.add_argument("--active-days", type=int, default=30)
+    work = sub.add_parser("run", help="process the campaign's pending jobs")
+    work.add_argument("campaign")
+    work.add_argument("--concurrency", type=int, default=16)
+    work.add_argument("--max-attempts", type=int, default=3)
+    work.add_argument("--base-url", default=None, help="Anthropic endpoint, overrides ANTHROPIC_BASE_URL")
+    show = sub.add_parser("status", help="count jobs by status")
+    show.add_argument("campaign")
+    args = parser.parse_args(argv)
+
+    create_db_and_tables()
+    if args.command == "enqueue":
+        print(f"[prompt_batch] enqueued {enqueue(args.campaign, args.novelty, args.active_days)} jobs for {args.campaign}", flush=True)
+    elif args.command == "status":
+        print(json.dumps(status(args.campaign)))
+    else:
+        if args.base_url:
+            os.environ["ANTHROPIC_BASE_URL"] = args.base_url
+
+        async def go() -> Counter:
+            try:
+                return await run(args.campaign, args.concurrency, args.max_attempts)
+            finally:
+                await close_anthropic_client()
+
+        started = time.perf_counter()
+        results = asyncio.run(go())
+        elapsed = time.perf_counter() - started
+        finished = results["done"] + results["failed"]
+        print(
+            f"[prompt_batch] {results['done']} done, {results['failed']} failed permanently, "
+            f"{results['pending']} retries in {elapsed:.1f}s ({finished / elapsed * 60 if elapsed else 0:.0f} jobs/min), "
+            f"tokens in={usage_stats['input_tokens']} out={usage_stats['output_tokens']} "
+            f"cache_read={usage_stats['cache_read_input_tokens']}",
+            flush=True,
+        )
+        sys.exit(1 if results["failed"] and not results["done"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Refresh cached taste profiles for recently active users ahead of their next visit.
+
+    cd backend && python refresh_worker.py [--active-days 7] [--min-age-minutes 60] [--concurrency 4] [--limit N] [--spotify-rate 2]
+
+Meant to run from cron (e.g. nightly). Users count as active by User.last_seen_at, which the
+request path updates. Builds go through the same path as /analyze, at the background Spotify
+priority. That priority only orders calls within this process: the worker has its own rate
+governor, so its Spotify calls come on top of the server's budget and are capped separately by
+--spotify-rate. The exit status is 1 only if every due user failed.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from sqlmodel import Session, or_, select
+
+from db import User, create_db_and_tables, engine
+from services.http_clients import close_clients
+from services.profiles import build_profile
+from services.rate_limit import BACKGROUND, RateLimitShed
+from services.spotify import governor
+
+
+def due_users(active_days: int, min_age: timedelta, limit: int | None) -> list[str]:
+    """Users seen in the last `active_days` whose profile is missing or older than `min_age`, oldest first."""
+    now = datetime.utcnow()
+    query = (
+        select(User.id)
+        .where(
+            User.last_seen_at >= now - timedelta(days=active_days),
+            or_(User.profile_cache_at.is_(None), User.profile_cache_at < now - min_age),
+        )
+        .order_by(User.profile_cache_at.nulls_first())
+    )
+    if limit:
+        query = query.limit(limit)
+    with Session(engine) as session:
+        return list(session.exec(query).all())
+
+
+async def refresh_user(user_id: str) -> None:
+    try:
+        await build_profile(user_id, priority=BACKGROUND)
+    except RateLimitShed as e:
+        # The background queue is full; wait out the governor's estimate once before giving up.
+        await asyncio.sleep(e.retry_after)
+        await build_profile(user_id, priority=BACKGROUND)
+
+
+async def run(user_ids: list[str], concurrency: int) -> Counter:
+    semaphore = asyncio.Semaphore(concurrency)
+    results: Counter = Counter()
+    started = time.perf_counter()
+
+    async def one(user_id: str):
+        async with semaphore:
+            try:
+                await refresh_user(user_id)
+                results["ok"] += 1
+            except Exception as exc:
+                results["failed"] += 1
+                results[f"failed:{type(exc).__name__}"] += 1
+                print(f"[refresh_worker] {user_id} failed: {exc!r}", flush=True)
+        done = results["ok"] + results["failed"]
+        if done % 25 == 0:
+            elapsed = time.perf_counter() - started
+            print(f"[refresh_worker] {done}/{len(user_ids)} done, {done / elapsed * 60:.1f} users/min", flush=True)
+
+    await asyncio.gather(*(one(uid) for uid in user_ids))
+    return results
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Refresh cached taste profiles for recently active users")
+    parser.add_argument("--active-days", type=int, default=7, help="only users seen this recently")
+    parser.add_argument("--min-age-minutes", type=int, default=60, help="skip profiles newer than this")
+    parser.add_argument("--concurrency", type=int, default=4, help="users refreshed in parallel")
+    parser.add_argument("--limit", type=int, default=None, help="refresh at most this many users")
+    parser.add_argument(
+        "--spotify-rate", type=float, default=2.0,
+        help="Spotify requests/sec for this worker, spent on top of the server's own SPOTIFY_RATE_PER_SEC",
+    )
+    args = parser.parse_args(argv)
+
+    create_db_and_tables()
+    governor.cap(args.spotify_rate)
+    user_ids = due_users(args.active_days, timedelta(minutes=args.min_age_minutes), args.limit)
+    print(f"[refresh_worker] {len(user_ids)} users due (concurrency={args.concurrency})", flush=True)
+
+    async def go() -> Counter:
+        try:
+            return await run(user_ids, args.concurrency)
+        finally:
+            await close_clients()
+
+    started = time.perf_counter()
+    results = asyncio.run(go())
+    elapsed = time.perf_counter() - started
+    rate = len(user_ids) / elapsed * 60 if elapsed > 0 else 0.0
+    failures = ", ".join(f"{k.split(':', 1)[1]}={v}" for k, v in sorted(results.items()) if k.startswith("failed:"))
+    print(
+        f"[refresh_worker] refreshed {results['ok']}/{len(user_ids)} users in {elapsed:.1f}s "
+        f"({rate:.1f} users/min), {results['failed']} failed" + (f" ({failures})" if failures else ""),
+        flush=True,
+    )
+    sys.exit(1 if user_ids and not results["ok"] else 0)
+
+
+if __name__ == "__main__":
+    main()
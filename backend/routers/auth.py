@@ -8,7 +8,9 @@ from jose import jwt
 from sqlmodel import Session, select
 
 from db import User, get_session
+from services.profiles import invalidate as invalidate_profile
 from services.spotify import SpotifyClient, exchange_code, get_auth_url
+from services.token_refresh import token_refresher
 
 router = APIRouter()
 
@@ -52,6 +54,8 @@ async def callback(code: str, response: Response, session: Session = Depends(get
         existing.access_token = access_token
         existing.refresh_token = refresh_token or existing.refresh_token
         existing.token_expiry = token_expiry
+        existing.profile_cache_at = None
+        existing.last_seen_at = datetime.utcnow()
         session.add(existing)
     else:
         user = User(
@@ -60,9 +64,12 @@ async def callback(code: str, response: Response, session: Session = Depends(get
             access_token=access_token,
             refresh_token=refresh_token,
             token_expiry=token_expiry,
+            last_seen_at=datetime.utcnow(),
         )
         session.add(user)
     session.commit()
+    token_refresher.touch(user_id)
+    invalidate_profile(user_id)
 
     jwt_token = create_jwt(user_id)
 
@@ -1,6 +1,7 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException, Path, Response
 from pydantic import BaseModel
 
+from services.captcha_watcher import captcha_watcher
 from services.suno import submit_captcha_solution
 
 router = APIRouter()
@@ -20,3 +21,16 @@ async def solve_captcha(body: SolveRequest):
     coords = [{"x": c.x, "y": c.y} for c in body.coordinates]
     ok = await submit_captcha_solution(coords)
     return {"ok": ok}
+
+
+@router.get("/captcha/image/{digest}")
+async def captcha_image(digest: str = Path(pattern="^[0-9a-f]{64}$"), if_none_match: str | None = Header(None)):
+    """A CAPTCHA screenshot by its SHA-256; the content never changes, so browsers may cache it for good."""
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    image = await captcha_watcher.image(digest)
+    if image is None:
+        raise HTTPException(status_code=404, detail="CAPTCHA image not found")
+    return Response(image, media_type="image/png", headers=headers)
@@ -1,9 +1,12 @@
 import re
 from collections import Counter
+from datetime import datetime, timedelta
 from statistics import median
 
 from pydantic import BaseModel
 
+from services.records import ARTIST_SOURCES, TRACK_SOURCES, Library
+
 
 class TasteProfile(BaseModel):
     top_genres: list[str]
@@ -20,6 +23,7 @@ class TasteProfile(BaseModel):
 
 GENRE_CLUSTER_MAP = {
     "indie": "indie",
+    "alternative": "alternative",
     "alt": "alternative",
     "rock": "rock",
     "pop": "pop",
@@ -34,6 +38,7 @@ GENRE_CLUSTER_MAP = {
     "techno": "electronic",
     "ambient": "electronic",
     "metal": "metal",
+    "deathcore": "metal",
     "punk": "punk",
     "jazz": "jazz",
     "classical": "classical",
@@ -53,12 +58,49 @@ def _extract_year(release_date: str) -> int | None:
     return int(match.group(1)) if match else None
 
 
+# Keys that only count at the start of a word: "alt" means "alt-country" or "alt rock", not "salt" or "cobalt".
+WORD_START_ONLY = {"alt"}
+
+
+class GenreMatcher:
+    """Maps a genre to the cluster of the first GENRE_CLUSTER_MAP key it contains, in map order.
+
+    Keys match anywhere in the genre, as substrings, so "electropop" finds "pop" and "jazz rap"
+    finds "jazz"; only keys in WORD_START_ONLY must also start a word. A cold lookup costs about
+    as much as the plain substring scan; the speedup comes from memoising results per lowercased
+    genre for the whole process.
+    """
+
+    def __init__(self, mapping: dict[str, str], memo_size: int = 8192, word_start_only: set[str] = WORD_START_ONLY):
+        self._keys = [
+            (key, cluster, re.compile(r"(?<![^\W_])" + re.escape(key)) if key in word_start_only else None)
+            for key, cluster in mapping.items()
+        ]
+        self._memo: dict[str, str | None] = {}
+        self._memo_size = memo_size
+
+    def _scan(self, text: str) -> str | None:
+        for key, cluster, anchored in self._keys:
+            if key in text and (anchored is None or anchored.search(text)):
+                return cluster
+        return None
+
+    def match(self, genre: str) -> str | None:
+        key = genre.lower()
+        if key in self._memo:
+            return self._memo[key]
+        cluster = self._scan(key)
+        if len(self._memo) >= self._memo_size:
+            self._memo.clear()
+        self._memo[key] = cluster
+        return cluster
+
+
+_genre_matcher = GenreMatcher(GENRE_CLUSTER_MAP)
+
+
 def _cluster_genre(genre: str) -> str | None:
-    genre_lower = genre.lower()
-    for key, cluster in GENRE_CLUSTER_MAP.items():
-        if key in genre_lower:
-            return cluster
-    return None
+    return _genre_matcher.match(genre)
 
 
 WEIGHTS = {
@@ -69,6 +111,50 @@ WEIGHTS = {
     "top_long": 1.0,
 }
 
+ARTIST_SOURCE_WEIGHTS = {"top_artists_short": 2.5, "top_artists_medium": 1.5}
+
+DEFAULT_ERA_RANGE = "2010s-2020s"
+DEFAULT_ERA_CENTER = 2018
+
+
+def _valid_year(year: int | None) -> bool:
+    return bool(year) and 1950 <= year <= 2030
+
+
+def _valid_popularity(pop) -> bool:
+    return isinstance(pop, (int, float)) and pop > 0
+
+
+def _era_range(era_min: int, era_max: int) -> str:
+    return f"{(era_min // 10) * 10}s-{(era_max // 10) * 10}s"
+
+
+def _sample_tracks_and_artists(data: dict) -> tuple[list[str], list[str]]:
+    short_tracks = data.get("top_short", [])
+    sample_top_tracks = [
+        f"{t['name']} — {', '.join(t['artists'])}" for t in short_tracks[:10]
+    ]
+
+    artist_names_short = [a["name"] for a in data.get("top_artists_short", [])]
+    artist_names_medium = [a["name"] for a in data.get("top_artists_medium", [])]
+    seen = set()
+    sample_top_artists = []
+    for name in artist_names_short + artist_names_medium:
+        if name not in seen:
+            seen.add(name)
+            sample_top_artists.append(name)
+        if len(sample_top_artists) >= 10:
+            break
+    return sample_top_tracks, sample_top_artists
+
+
+def _confidence(total_tracks: int) -> str:
+    if total_tracks >= 80:
+        return "high"
+    if total_tracks >= 30:
+        return "medium"
+    return "low"
+
 
 def build_taste_profile(data: dict) -> TasteProfile:
     genre_counter: Counter = Counter()
@@ -84,21 +170,20 @@ def build_taste_profile(data: dict) -> TasteProfile:
             for g in track.get("genres", []):
                 genre_counter[g] += weight
             year = _extract_year(track.get("release_date", ""))
-            if year and 1950 <= year <= 2030:
+            if _valid_year(year):
                 years.append(year)
             pop = track.get("popularity")
-            if isinstance(pop, (int, float)) and pop > 0:
+            if _valid_popularity(pop):
                 popularity_values.append(pop)
             if track.get("explicit"):
                 explicit_count += 1
 
-    ARTIST_SOURCE_WEIGHTS = {"top_artists_short": 2.5, "top_artists_medium": 1.5}
     for source, weight in ARTIST_SOURCE_WEIGHTS.items():
         for artist in data.get(source, []):
             for g in artist.get("genres") or []:
                 genre_counter[g] += weight
             pop = artist.get("popularity")
-            if isinstance(pop, (int, float)) and pop > 0:
+            if _valid_popularity(pop):
                 popularity_values.append(pop)
 
     top_genres = [g for g, _ in genre_counter.most_common(8)]
@@ -114,29 +199,13 @@ def build_taste_profile(data: dict) -> TasteProfile:
         sorted_years = sorted(years)
         era_min = sorted_years[len(sorted_years) // 10] if len(sorted_years) > 10 else sorted_years[0]
         era_max = sorted_years[-1]
-        era_min_decade = (era_min // 10) * 10
-        era_max_decade = (era_max // 10) * 10
-        era_range = f"{era_min_decade}s-{era_max_decade}s"
+        era_range = _era_range(era_min, era_max)
         era_center = int(median(years))
     else:
-        era_range = "2010s-2020s"
-        era_center = 2018
+        era_range = DEFAULT_ERA_RANGE
+        era_center = DEFAULT_ERA_CENTER
 
-    short_tracks = data.get("top_short", [])
-    sample_top_tracks = [
-        f"{t['name']} — {', '.join(t['artists'])}" for t in short_tracks[:10]
-    ]
-
-    artist_names_short = [a["name"] for a in data.get("top_artists_short", [])]
-    artist_names_medium = [a["name"] for a in data.get("top_artists_medium", [])]
-    seen = set()
-    sample_top_artists = []
-    for name in artist_names_short + artist_names_medium:
-        if name not in seen:
-            seen.add(name)
-            sample_top_artists.append(name)
-        if len(sample_top_artists) >= 10:
-            break
+    sample_top_tracks, sample_top_artists = _sample_tracks_and_artists(data)
 
     popularity_avg = sum(popularity_values) / len(popularity_values) if popularity_values else 50.0
     explicit_ratio = explicit_count / total_tracks if total_tracks > 0 else 0.0
@@ -144,13 +213,6 @@ def build_taste_profile(data: dict) -> TasteProfile:
     print(f"[analyzer] tracks={total_tracks}, genres={len(genre_counter)}, popularity_samples={len(popularity_values)}, popularity_avg={popularity_avg:.1f}", flush=True)
     print(f"[analyzer] top_genres={top_genres[:5]}", flush=True)
 
-    if total_tracks >= 80:
-        confidence = "high"
-    elif total_tracks >= 30:
-        confidence = "medium"
-    else:
-        confidence = "low"
-
     return TasteProfile(
         top_genres=top_genres,
         genre_clusters=genre_clusters,
@@ -161,5 +223,197 @@ def build_taste_profile(data: dict) -> TasteProfile:
         popularity_avg=round(popularity_avg, 1),
         explicit_ratio=round(explicit_ratio, 2),
         track_count=total_tracks,
-        confidence=confidence,
+        confidence=_confidence(total_tracks),
     )
+
+
+def _weighted_rank(histogram: list[tuple[int, float]], rank: float) -> int:
+    """Value at a 0-based rank of a sorted (value, weight) histogram, i.e. the first value whose cumulative weight exceeds it."""
+    cumulative = 0.0
+    for value, weight in histogram:
+        cumulative += weight
+        if cumulative > rank:
+            return value
+    return histogram[-1][0]
+
+
+class TasteState(BaseModel):
+    """Mergeable per-user aggregate behind a TasteProfile.
+
+    Holds weighted sums rather than tracks, so states can be merged, decayed over time and turned
+    into a TasteProfile in O(distinct genres + distinct years). With whole-number weights,
+    TasteState.from_data(data).to_profile() equals build_taste_profile(data).
+
+    `last_event_at` is the newest listening event folded in, so the next delta starts after it.
+    """
+
+    genre_weights: dict[str, float] = {}
+    year_weights: dict[int, float] = {}
+    popularity_sum: float = 0.0
+    popularity_count: float = 0.0
+    explicit_count: float = 0.0
+    track_count: float = 0.0
+    sample_top_tracks: list[str] = []
+    sample_top_artists: list[str] = []
+    updated_at: datetime | None = None
+    last_event_at: datetime | None = None
+
+    @classmethod
+    def from_data(cls, data: dict, now: datetime | None = None) -> "TasteState":
+        state = cls(updated_at=now or datetime.utcnow())
+        genre_weights = state.genre_weights
+        for source, weight in WEIGHTS.items():
+            for track in data.get(source, []):
+                state.track_count += 1
+                for g in track.get("genres", []):
+                    genre_weights[g] = genre_weights.get(g, 0.0) + weight
+                year = _extract_year(track.get("release_date", ""))
+                if _valid_year(year):
+                    state.year_weights[year] = state.year_weights.get(year, 0.0) + 1
+                pop = track.get("popularity")
+                if _valid_popularity(pop):
+                    state.popularity_sum += pop
+                    state.popularity_count += 1
+                if track.get("explicit"):
+                    state.explicit_count += 1
+        for source, weight in ARTIST_SOURCE_WEIGHTS.items():
+            for artist in data.get(source, []):
+                for g in artist.get("genres") or []:
+                    genre_weights[g] = genre_weights.get(g, 0.0) + weight
+                pop = artist.get("popularity")
+                if _valid_popularity(pop):
+                    state.popularity_sum += pop
+                    state.popularity_count += 1
+        state.sample_top_tracks, state.sample_top_artists = _sample_tracks_and_artists(data)
+        return state
+
+    @classmethod
+    def from_library(cls, library: Library, now: datetime | None = None, sources: tuple[str, ...] = TRACK_SOURCES + ARTIST_SOURCES) -> "TasteState":
+        """Same as from_data(library.to_data()), read straight from the compact records.
+
+        Only the given track and artist `sources` are counted. Genre weights are summed per
+        interned genre ID and named once at the end, so no per-track genre list is built.
+        """
+        state = cls(updated_at=now or datetime.utcnow())
+        artists = library.artists
+        weights_by_id: dict[int, float] = {}
+        years_by_date: dict[str, int | None] = {}
+        for source, weight in WEIGHTS.items():
+            if source not in sources:
+                continue
+            for track in library.tracks.get(source, []):
+                state.track_count += 1
+                for index in track.artists:
+                    for gid in artists[index].genre_ids:
+                        weights_by_id[gid] = weights_by_id.get(gid, 0.0) + weight
+                if track.release_date not in years_by_date:
+                    years_by_date[track.release_date] = _extract_year(track.release_date)
+                year = years_by_date[track.release_date]
+                if _valid_year(year):
+                    state.year_weights[year] = state.year_weights.get(year, 0.0) + 1
+                if _valid_popularity(track.popularity):
+                    state.popularity_sum += track.popularity
+                    state.popularity_count += 1
+                if track.explicit:
+                    state.explicit_count += 1
+        for source, weight in ARTIST_SOURCE_WEIGHTS.items():
+            if source not in sources:
+                continue
+            for index in library.top_artists.get(source, []):
+                artist = artists[index]
+                for gid in artist.genre_ids:
+                    weights_by_id[gid] = weights_by_id.get(gid, 0.0) + weight
+                if _valid_popularity(artist.popularity):
+                    state.popularity_sum += artist.popularity
+                    state.popularity_count += 1
+        state.genre_weights = {library.genres[gid]: w for gid, w in weights_by_id.items()}
+
+        samples = {
+            "top_short": [
+                {"name": t.name, "artists": [artists[i].name for i in t.artists]}
+                for t in library.tracks.get("top_short", [])[:10]
+            ] if "top_short" in sources else [],
+        }
+        for source in ARTIST_SOURCES:
+            indices = library.top_artists.get(source, []) if source in sources else []
+            samples[source] = [{"name": artists[i].name} for i in indices]
+        state.sample_top_tracks, state.sample_top_artists = _sample_tracks_and_artists(samples)
+        return state
+
+    def decayed(self, half_life: timedelta, now: datetime | None = None) -> "TasteState":
+        """Copy with every contribution scaled by 0.5 ** (time since updated_at / half_life)."""
+        now = now or datetime.utcnow()
+        if self.updated_at is None or now <= self.updated_at:
+            return self.model_copy(deep=True)
+        factor = 0.5 ** ((now - self.updated_at) / half_life)
+        return TasteState(
+            genre_weights={g: w * factor for g, w in self.genre_weights.items()},
+            year_weights={y: w * factor for y, w in self.year_weights.items()},
+            popularity_sum=self.popularity_sum * factor,
+            popularity_count=self.popularity_count * factor,
+            explicit_count=self.explicit_count * factor,
+            track_count=self.track_count * factor,
+            sample_top_tracks=list(self.sample_top_tracks),
+            sample_top_artists=list(self.sample_top_artists),
+            updated_at=now,
+            last_event_at=self.last_event_at,
+        )
+
+    def merge(self, newer: "TasteState") -> "TasteState":
+        """Sum of both states; samples come from `newer` when it has any."""
+        genre_weights = dict(self.genre_weights)
+        for g, w in newer.genre_weights.items():
+            genre_weights[g] = genre_weights.get(g, 0.0) + w
+        year_weights = dict(self.year_weights)
+        for y, w in newer.year_weights.items():
+            year_weights[y] = year_weights.get(y, 0.0) + w
+        stamps = [t for t in (self.updated_at, newer.updated_at) if t]
+        events = [t for t in (self.last_event_at, newer.last_event_at) if t]
+        return TasteState(
+            genre_weights=genre_weights,
+            year_weights=year_weights,
+            popularity_sum=self.popularity_sum + newer.popularity_sum,
+            popularity_count=self.popularity_count + newer.popularity_count,
+            explicit_count=self.explicit_count + newer.explicit_count,
+            track_count=self.track_count + newer.track_count,
+            sample_top_tracks=newer.sample_top_tracks or self.sample_top_tracks,
+            sample_top_artists=newer.sample_top_artists or self.sample_top_artists,
+            updated_at=max(stamps) if stamps else None,
+            last_event_at=max(events) if events else None,
+        )
+
+    def to_profile(self) -> TasteProfile:
+        ranked_genres = sorted(self.genre_weights.items(), key=lambda item: item[1], reverse=True)
+        cluster_weights: dict[str, float] = {}
+        for genre, weight in self.genre_weights.items():
+            cluster = _cluster_genre(genre)
+            if cluster:
+                cluster_weights[cluster] = cluster_weights.get(cluster, 0.0) + weight
+        ranked_clusters = sorted(cluster_weights.items(), key=lambda item: item[1], reverse=True)
+
+        histogram = sorted((y, w) for y, w in self.year_weights.items() if w > 0)
+        total_years = sum(w for _, w in histogram)
+        if histogram and total_years > 0:
+            era_min = _weighted_rank(histogram, total_years // 10 if total_years > 10 else 0)
+            era_max = histogram[-1][0]
+            low = _weighted_rank(histogram, (total_years - 1) // 2)
+            high = _weighted_rank(histogram, total_years // 2)
+            era_range, era_center = _era_range(era_min, era_max), int((low + high) / 2)
+        else:
+            era_range, era_center = DEFAULT_ERA_RANGE, DEFAULT_ERA_CENTER
+
+        track_count = int(round(self.track_count))
+        popularity_avg = self.popularity_sum / self.popularity_count if self.popularity_count > 0 else 50.0
+        explicit_ratio = self.explicit_count / self.track_count if self.track_count > 0 else 0.0
+        return TasteProfile(
+            top_genres=[g for g, _ in ranked_genres[:8]],
+            genre_clusters=[c for c, _ in ranked_clusters[:5]],
+            era_range=era_range,
+            era_center=era_center,
+            sample_top_tracks=self.sample_top_tracks,
+            sample_top_artists=self.sample_top_artists,
+            popularity_avg=round(popularity_avg, 1),
+            explicit_ratio=round(explicit_ratio, 2),
+            track_count=track_count,
+            confidence=_confidence(track_count),
+        )
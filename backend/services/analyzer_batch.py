@@ -0,0 +1,165 @@
+import numpy as np
+
+from services.analyzer import (
+    ARTIST_SOURCE_WEIGHTS,
+    DEFAULT_ERA_CENTER,
+    DEFAULT_ERA_RANGE,
+    WEIGHTS,
+    TasteProfile,
+    _cluster_genre,
+    _confidence,
+    _era_range,
+    _extract_year,
+    _sample_tracks_and_artists,
+    _valid_popularity,
+    _valid_year,
+)
+
+
+class _Columns:
+    """Flat per-row arrays for a batch of users, in the same visiting order as build_taste_profile."""
+
+    def __init__(self, batch: list[dict]):
+        self.genre_vocab: dict[str, int] = {}
+        genre_user, genre_id, genre_weight = [], [], []
+        year_user, year_value = [], []
+        pop_user, pop_value = [], []
+        track_count, explicit_count = [], []
+        vocab = self.genre_vocab
+        years_by_date: dict[str, int | None] = {}
+
+        for user, data in enumerate(batch):
+            tracks = explicit = 0
+            for source, weight in WEIGHTS.items():
+                for track in data.get(source, []):
+                    tracks += 1
+                    for g in track.get("genres", []):
+                        gid = vocab.get(g)
+                        if gid is None:
+                            gid = vocab[g] = len(vocab)
+                        genre_user.append(user)
+                        genre_id.append(gid)
+                        genre_weight.append(weight)
+                    # Release dates repeat heavily across a library, so parse each distinct one once.
+                    release_date = track.get("release_date", "")
+                    if release_date not in years_by_date:
+                        years_by_date[release_date] = _extract_year(release_date)
+                    year = years_by_date[release_date]
+                    if _valid_year(year):
+                        year_user.append(user)
+                        year_value.append(year)
+                    pop = track.get("popularity")
+                    if _valid_popularity(pop):
+                        pop_user.append(user)
+                        pop_value.append(pop)
+                    if track.get("explicit"):
+                        explicit += 1
+            track_count.append(tracks)
+            explicit_count.append(explicit)
+            for source, weight in ARTIST_SOURCE_WEIGHTS.items():
+                for artist in data.get(source, []):
+                    for g in artist.get("genres") or []:
+                        gid = vocab.get(g)
+                        if gid is None:
+                            gid = vocab[g] = len(vocab)
+                        genre_user.append(user)
+                        genre_id.append(gid)
+                        genre_weight.append(weight)
+                    pop = artist.get("popularity")
+                    if _valid_popularity(pop):
+                        pop_user.append(user)
+                        pop_value.append(pop)
+
+        self.track_count = np.asarray(track_count, dtype=np.int64)
+        self.explicit_count = np.asarray(explicit_count, dtype=np.int64)
+        self.genre_user = np.asarray(genre_user, dtype=np.int64)
+        self.genre_id = np.asarray(genre_id, dtype=np.int64)
+        self.genre_weight = np.asarray(genre_weight, dtype=np.float64)
+        self.year_user = np.asarray(year_user, dtype=np.int64)
+        self.year_value = np.asarray(year_value, dtype=np.int64)
+        self.pop_user = np.asarray(pop_user, dtype=np.int64)
+        self.pop_value = np.asarray(pop_value, dtype=np.float64)
+
+
+def _ranked_per_user(users: np.ndarray, items: np.ndarray, weights: np.ndarray, first_seen: np.ndarray, n_users: int, limit: int) -> list[list[int]]:
+    """Top `limit` items per user by summed weight, ties broken by first appearance (Counter.most_common order)."""
+    if not len(users):
+        return [[] for _ in range(n_users)]
+    order = np.lexsort((first_seen, -weights, users))
+    users, items = users[order], items[order]
+    bounds = np.searchsorted(users, np.arange(n_users + 1))
+    return [items[bounds[u] : min(bounds[u] + limit, bounds[u + 1])].tolist() for u in range(n_users)]
+
+
+def build_taste_profiles(batch: list[dict]) -> list[TasteProfile]:
+    """Columnar equivalent of build_taste_profile for many users at once.
+
+    Each element of `batch` is a fetch_all_data payload; the result list is in the same order and
+    matches build_taste_profile field for field.
+    """
+    n_users = len(batch)
+    cols = _Columns(batch)
+    n_genres = max(len(cols.genre_vocab), 1)
+    genre_names = list(cols.genre_vocab)
+
+    # Weighted genre counts per (user, genre), remembering where each pair was first seen.
+    pair_keys, pair_first, pair_inverse = np.unique(cols.genre_user * n_genres + cols.genre_id, return_index=True, return_inverse=True)
+    pair_weight = np.bincount(pair_inverse, weights=cols.genre_weight, minlength=len(pair_keys))
+    pair_user, pair_genre = pair_keys // n_genres, pair_keys % n_genres
+    top_genre_ids = _ranked_per_user(pair_user, pair_genre, pair_weight, pair_first, n_users, 8)
+
+    # Cluster totals: fold genre totals in first-seen order so float sums match Counter's.
+    cluster_index: dict[str, int] = {}
+    genre_cluster = np.full(n_genres, -1, dtype=np.int64)
+    for gid, name in enumerate(genre_names):
+        cluster = _cluster_genre(name)
+        if cluster:
+            genre_cluster[gid] = cluster_index.setdefault(cluster, len(cluster_index))
+    cluster_names = list(cluster_index)
+    by_first = np.argsort(pair_first, kind="stable")
+    clustered = by_first[genre_cluster[pair_genre[by_first]] >= 0]
+    n_clusters = max(len(cluster_names), 1)
+    cluster_keys = pair_user[clustered] * n_clusters + genre_cluster[pair_genre[clustered]]
+    ckeys, cfirst, cinverse = np.unique(cluster_keys, return_index=True, return_inverse=True)
+    cweight = np.bincount(cinverse, weights=pair_weight[clustered], minlength=len(ckeys))
+    top_cluster_ids = _ranked_per_user(ckeys // n_clusters, ckeys % n_clusters, cweight, cfirst, n_users, 5)
+
+    # Era: per-user sorted years, then index arithmetic for the 10th percentile, max and median.
+    year_order = np.lexsort((cols.year_value, cols.year_user))
+    years_sorted = cols.year_value[year_order]
+    year_counts = np.bincount(cols.year_user, minlength=n_users)
+    year_starts = np.cumsum(year_counts) - year_counts
+
+    pop_sum = np.bincount(cols.pop_user, weights=cols.pop_value, minlength=n_users)
+    pop_count = np.bincount(cols.pop_user, minlength=n_users)
+
+    profiles = []
+    for user, data in enumerate(batch):
+        n_years = int(year_counts[user])
+        if n_years:
+            start = int(year_starts[user])
+            era_min = int(years_sorted[start + (n_years // 10 if n_years > 10 else 0)])
+            era_max = int(years_sorted[start + n_years - 1])
+            middle = (years_sorted[start + (n_years - 1) // 2] + years_sorted[start + n_years // 2]) / 2
+            era_range, era_center = _era_range(era_min, era_max), int(middle)
+        else:
+            era_range, era_center = DEFAULT_ERA_RANGE, DEFAULT_ERA_CENTER
+
+        track_count = int(cols.track_count[user])
+        popularity_avg = pop_sum[user] / pop_count[user] if pop_count[user] else 50.0
+        explicit_ratio = cols.explicit_count[user] / track_count if track_count > 0 else 0.0
+        sample_top_tracks, sample_top_artists = _sample_tracks_and_artists(data)
+
+        profiles.append(TasteProfile(
+            top_genres=[genre_names[g] for g in top_genre_ids[user]],
+            genre_clusters=[cluster_names[c] for c in top_cluster_ids[user]],
+            era_range=era_range,
+            era_center=era_center,
+            sample_top_tracks=sample_top_tracks,
+            sample_top_artists=sample_top_artists,
+            popularity_avg=round(float(popularity_avg), 1),
+            explicit_ratio=round(float(explicit_ratio), 2),
+            track_count=track_count,
+            confidence=_confidence(track_count),
+        ))
+    return profiles
@@ -0,0 +1,78 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, select
+
+from db import CachedArtist, engine
+from services.cache import TTLCache
+
+ARTIST_CACHE_TTL = timedelta(days=int(os.getenv("ARTIST_CACHE_TTL_DAYS", "7")))
+ARTIST_CACHE_NEGATIVE_TTL = timedelta(hours=int(os.getenv("ARTIST_CACHE_NEGATIVE_TTL_HOURS", "24")))
+ARTIST_CACHE_SIZE = int(os.getenv("ARTIST_CACHE_SIZE", "20000"))
+
+# SQLite caps bound parameters per statement, so large IN (...) lookups are chunked.
+_DB_CHUNK = 500
+
+_memory = TTLCache(ARTIST_CACHE_SIZE)
+
+
+def _ttl_for(genres: list[str]) -> timedelta:
+    # Artists without genres are cached as negative entries and re-checked sooner.
+    return ARTIST_CACHE_TTL if genres else ARTIST_CACHE_NEGATIVE_TTL
+
+
+def _as_artist(row: CachedArtist) -> dict:
+    return {"id": row.id, "name": row.name, "genres": json.loads(row.genres), "popularity": row.popularity}
+
+
+def get_cached_artists(artist_ids: list[str]) -> tuple[dict[str, dict], list[str]]:
+    """Split artist IDs into ({id: artist} still fresh in the cache, [ids to fetch from Spotify])."""
+    found: dict[str, dict] = {}
+    not_in_memory = []
+    for artist_id in artist_ids:
+        artist = _memory.get(artist_id)
+        if artist is not None:
+            found[artist_id] = {**artist, "genres": list(artist["genres"])}
+        else:
+            not_in_memory.append(artist_id)
+
+    if not_in_memory:
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            for i in range(0, len(not_in_memory), _DB_CHUNK):
+                chunk = not_in_memory[i : i + _DB_CHUNK]
+                for row in session.exec(select(CachedArtist).where(CachedArtist.id.in_(chunk))):
+                    artist = _as_artist(row)
+                    remaining = _ttl_for(artist["genres"]) - (now - row.fetched_at)
+                    if remaining.total_seconds() <= 0:
+                        continue
+                    _memory.set(row.id, artist, remaining.total_seconds())
+                    found[row.id] = {**artist, "genres": list(artist["genres"])}
+
+    missing = [artist_id for artist_id in artist_ids if artist_id not in found]
+    return found, missing
+
+
+def store_artists(artists: list[dict]):
+    """Upsert Spotify artist payloads into both cache tiers."""
+    latest = {a["id"]: a for a in artists if a and a.get("id")}
+    if not latest:
+        return
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        ids = list(latest)
+        existing = {}
+        for i in range(0, len(ids), _DB_CHUNK):
+            chunk = ids[i : i + _DB_CHUNK]
+            existing.update({row.id: row for row in session.exec(select(CachedArtist).where(CachedArtist.id.in_(chunk)))})
+        for artist_id, a in latest.items():
+            genres = list(a.get("genres") or [])
+            row = existing.get(artist_id) or CachedArtist(id=artist_id, name=a.get("name", ""))
+            row.name = a.get("name", row.name)
+            row.genres = json.dumps(genres)
+            row.popularity = a.get("popularity", 0) or 0
+            row.fetched_at = now
+            session.add(row)
+            _memory.set(artist_id, {"id": artist_id, "name": row.name, "genres": genres, "popularity": row.popularity}, _ttl_for(genres).total_seconds())
+        session.commit()
@@ -0,0 +1,120 @@
+import asyncio
+import base64
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+from services.suno import check_captcha_pending
+
+CAPTCHA_POLL_INTERVAL = float(os.getenv("CAPTCHA_POLL_INTERVAL", "2"))
+# Recent challenge images kept for clients that load one just after it was replaced.
+MAX_IMAGES = 4
+
+
+class CaptchaWatcher:
+    """One poller for suno-api's CAPTCHA state, shared by every generation waiting on Suno.
+
+    suno-api holds a single global pending CAPTCHA, so there is no point in each generation
+    polling it. The watcher polls only while someone is subscribed and publishes a change to
+    every subscriber's queue when the challenge appears, is replaced by a different image
+    (compared by hash), or clears. Subscribers get None when it clears.
+
+    Changes carry only the image's SHA-256 and URL; the decoded bytes are held once here and
+    served by the content-addressed /api/captcha/image/{hash} endpoint.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.current: dict | None = None
+        self._images: OrderedDict[str, bytes] = OrderedDict()
+        self._subscribers: set[asyncio.Queue] = set()
+        self._task: asyncio.Task | None = None
+        self._last_lookup = float("-inf")
+        self.stats = {"polls": 0, "changes": 0, "errors": 0, "lookups": 0}
+
+    def subscribe(self) -> asyncio.Queue:
+        """A queue receiving the current challenge, if any, and every change after it."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        if self.current is not None:
+            queue.put_nowait(self.current)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _store(self, encoded: str) -> str:
+        image = base64.b64decode(encoded)
+        digest = hashlib.sha256(image).hexdigest()
+        self._images[digest] = image
+        self._images.move_to_end(digest)
+        while len(self._images) > MAX_IMAGES:
+            self._images.popitem(last=False)
+        return digest
+
+    async def image(self, digest: str) -> bytes | None:
+        """The image with this hash, if this process has seen it.
+
+        Unknown hashes are looked up on suno-api only while there is no current challenge here (e.g.
+        another process published it), and at most once per poll interval, so requests for
+        made-up hashes cannot turn into a stream of suno-api calls.
+        """
+        if digest in self._images or self.current is not None:
+            return self._images.get(digest)
+        now = time.monotonic()
+        if now - self._last_lookup < self.interval:
+            return None
+        self._last_lookup = now
+        self.stats["lookups"] += 1
+        captcha = await check_captcha_pending()
+        if captcha:
+            self._store(captcha["image"])
+        return self._images.get(digest)
+
+    def _publish(self, captcha: dict | None):
+        digest = self._store(captcha["image"]) if captcha else None
+        if digest == (self.current or {}).get("hash"):
+            return
+        if captcha:
+            self.current = {"hash": digest, "image_url": f"/api/captcha/image/{digest}", "prompt": captcha["prompt"]}
+        else:
+            self.current = None
+        self.stats["changes"] += 1
+        for queue in self._subscribers:
+            queue.put_nowait(self.current)
+
+    async def _run(self):
+        while self._subscribers:
+            self.stats["polls"] += 1
+            try:
+                captcha = await check_captcha_pending()
+            except Exception as exc:
+                self.stats["errors"] += 1
+                print(f"[captcha] check failed: {exc}", flush=True)
+            else:
+                self._publish(captcha)
+            await asyncio.sleep(self.interval)
+        # Nobody is listening, so whatever we saw last may be outdated by the next subscription.
+        self.current = None
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "pending": self.current["hash"] if self.current else None,
+            **self.stats,
+        }
+
+
+captcha_watcher = CaptchaWatcher(CAPTCHA_POLL_INTERVAL)
@@ -0,0 +1,391 @@
+import asyncio
+import json
+import os
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, func, select, update
+
+from db import GeneratedTrack, GenerationEvent, GenerationJob, User, engine
+from services.analyzer import TasteProfile
+from services.captcha_watcher import captcha_watcher
+from services.profiles import get_profile
+from services.prompt_builder import stream_prompts
+from services.prompt_pool import take as take_pooled_prompt
+from services.rate_limit import RateLimitShed
+from services.suno import SunoError, poll_for_completion, submit_generation
+
+GENERATION_WORKERS = int(os.getenv("GENERATION_WORKERS", "4"))
+# A running job whose heartbeat is older than this belonged to a process that died; it is re-queued.
+GENERATION_JOB_STALE = timedelta(seconds=int(os.getenv("GENERATION_JOB_STALE_SECONDS", "60")))
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", "3"))
+HEARTBEAT_INTERVAL = 15
+SWEEP_INTERVAL = 30
+# Followers also re-read the event table this often, to pick up jobs run by another process.
+FOLLOW_POLL = 2.0
+TERMINAL_EVENTS = ("complete", "error")
+# Stand-ins for prompt fields Claude did not send before its stream failed after the Suno submit.
+PROMPT_DEFAULTS = {
+    "lyria_prompt": "",
+    "song_concept": "",
+    "mood": "",
+    "tempo_feel": "",
+    "energy_estimate": 0.5,
+    "valence_estimate": 0.5,
+}
+# Pause before a worker retries after an unexpected error, e.g. "database is locked".
+WORKER_ERROR_BACKOFF = 1.0
+
+_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# job_id -> event set (and replaced) whenever an event is written for the job in this process.
+_signals: dict[str, asyncio.Event] = {}
+
+
+def emit(job_id: str, event: str, data: dict) -> int:
+    """Append an event to the job's log and wake its followers; returns the event id."""
+    with Session(engine) as session:
+        row = GenerationEvent(job_id=job_id, event=event, data=json.dumps(data))
+        session.add(row)
+        session.commit()
+        event_id = row.id
+    signal = _signals.pop(job_id, None)
+    if signal is not None:
+        signal.set()
+    return event_id
+
+
+def events_after(job_id: str, after: int) -> list[GenerationEvent]:
+    with Session(engine) as session:
+        return session.exec(
+            select(GenerationEvent)
+            .where(GenerationEvent.job_id == job_id, GenerationEvent.id > after)
+            .order_by(GenerationEvent.id)
+        ).all()
+
+
+async def follow(job_id: str, after: int = 0, keepalive: float = 10.0):
+    """Yield the job's events after event id `after` as they are written, ending with a terminal one.
+
+    Yields None every `keepalive` seconds without news, so callers can keep idle connections open.
+    """
+    idle = 0.0
+    while True:
+        signal = _signals.setdefault(job_id, asyncio.Event())
+        for row in events_after(job_id, after):
+            idle, after = 0.0, row.id
+            yield row
+            if row.event in TERMINAL_EVENTS:
+                _signals.pop(job_id, None)
+                return
+        try:
+            await asyncio.wait_for(signal.wait(), timeout=FOLLOW_POLL)
+        except asyncio.TimeoutError:
+            idle += FOLLOW_POLL
+            if idle >= keepalive:
+                idle = 0.0
+                yield None
+
+
+def _update(job_id: str, **fields):
+    with Session(engine) as session:
+        job = session.get(GenerationJob, job_id)
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.utcnow()
+        session.add(job)
+        session.commit()
+
+
+async def _prompt_fields(user_id: str, profile: TasteProfile, novelty_level: float):
+    """(field, value) pairs of the prompt: from the speculative pool when one is ready, else streamed from Claude."""
+    pooled = take_pooled_prompt(user_id, profile, novelty_level)
+    if pooled is not None:
+        for item in pooled.items():
+            yield item
+        return
+    async for item in stream_prompts(profile, novelty_level):
+        yield item
+
+
+async def _watch_captcha(job_id: str, gen_task: asyncio.Task):
+    """Forward suno-api CAPTCHA challenges to the job's followers until the Suno submit returns."""
+    updates = captcha_watcher.subscribe()
+    change = None
+    try:
+        while not gen_task.done():
+            change = asyncio.ensure_future(updates.get())
+            await asyncio.wait({gen_task, change}, return_when=asyncio.FIRST_COMPLETED)
+            if not change.done():
+                return
+            captcha = change.result()
+            if captcha is not None:
+                print(f"[generate] CAPTCHA {captcha['hash'][:12]} sent to job {job_id}", flush=True)
+                emit(job_id, "captcha_required", captcha)
+    finally:
+        if change is not None:
+            change.cancel()
+        captcha_watcher.unsubscribe(updates)
+
+
+async def _run(job_id: str):
+    """Run a job from wherever it left off.
+
+    The prompts and the Suno clip id are saved as soon as they are known, so a job resumed after
+    a restart does not ask Claude or Suno again for what it already has. The time of the Suno
+    submit is saved before it is sent: a job interrupted between that and the clip id fails
+    instead of resubmitting, since Suno may already have started (and charged for) the clip.
+    """
+    with Session(engine) as session:
+        job = session.get(GenerationJob, job_id)
+        user = session.get(User, job.user_id)
+    if user is None:
+        raise LookupError("User not found")
+    if job.suno_submitted_at is not None and job.suno_id is None:
+        raise SunoError("Generation was interrupted while Suno was starting it. Please try again.")
+    prompts = json.loads(job.prompts) if job.prompts else None
+    suno_id = job.suno_id
+    gen_task = None
+
+    try:
+        if prompts is None:
+            emit(job_id, "status", {"stage": "building_prompt", "message": "Crafting your sound profile..."})
+            profile = await get_profile(user.id)
+
+            # Start Suno as soon as the prompt it needs is known, while Claude finishes the rest.
+            tags = ", ".join(profile.top_genres[:5])
+            submitted = None
+            if job.custom_prompt_override:
+                submitted = job.custom_prompt_override
+                _update(job_id, suno_submitted_at=datetime.utcnow())
+                gen_task = asyncio.create_task(submit_generation(submitted, tags))
+            prompts = {}
+            try:
+                async for field, value in _prompt_fields(user.id, profile, job.novelty_level):
+                    prompts[field] = value
+                    if field == "suno_prompt":
+                        emit(job_id, "suno_prompt_ready", {"suno_prompt": value})
+                        if gen_task is None:
+                            submitted = value
+                            _update(job_id, suno_submitted_at=datetime.utcnow())
+                            gen_task = asyncio.create_task(submit_generation(value, tags))
+            except Exception as exc:
+                if gen_task is None:
+                    raise
+                # Suno may already have accepted (and charged for) the clip, so finish it with
+                # defaults for whatever Claude did not get to send.
+                print(f"[generate] job {job_id}: prompt stream failed after the Suno submit, using defaults: {exc!r}", flush=True)
+            if gen_task is None:
+                raise ValueError("Prompt generation returned no suno_prompt")
+            prompts = {**PROMPT_DEFAULTS, "suno_prompt": submitted, **prompts}
+            _update(job_id, prompts=json.dumps(prompts), tags=tags)
+
+            emit(job_id, "prompt_ready", {field: prompts[field] for field in ("suno_prompt", *PROMPT_DEFAULTS)})
+
+        if suno_id is None:
+            emit(job_id, "status", {"stage": "generating", "message": "Generating your track..."})
+            await _watch_captcha(job_id, gen_task)
+            suno_id = await gen_task
+            _update(job_id, suno_id=suno_id)
+    except BaseException:
+        if gen_task is not None:
+            gen_task.cancel()
+        raise
+
+    print(f"[generate] job {job_id}: suno_id={suno_id}, waiting for completion", flush=True)
+    result = await poll_for_completion(suno_id)
+
+    # The track shares the job's id, so a job resumed after this insert does not save it twice.
+    with Session(engine) as session:
+        if session.get(GeneratedTrack, job_id) is None:
+            session.add(GeneratedTrack(
+                id=job_id,
+                user_id=user.id,
+                suno_track_id=suno_id,
+                audio_url=result["audio_url"],
+                image_url=result.get("image_url"),
+                suno_prompt=prompts["suno_prompt"],
+                lyria_prompt=prompts["lyria_prompt"],
+                song_concept=prompts["song_concept"],
+                platform=job.platform,
+            ))
+            session.commit()
+
+    emit(job_id, "complete", {
+        "audio_url": result["audio_url"],
+        "image_url": result.get("image_url", ""),
+        "track_id": job_id,
+        "title": result.get("title", "Your Reso Track"),
+        "suno_url": f"https://suno.com/song/{suno_id}",
+    })
+
+
+def _fail(job_id: str, message: str):
+    _update(job_id, status="failed", error=message)
+    emit(job_id, "error", {"message": message})
+
+
+class GenerationWorkers:
+    """A fixed pool of workers running generation jobs from the GenerationJob table.
+
+    Jobs run independently of the request that created them: clients follow a job's event log
+    and can disconnect and resume at any point. Running jobs send a heartbeat; jobs whose
+    process died are re-queued by any process's sweep and resume from their saved progress,
+    up to max_attempts runs in total.
+    """
+
+    def __init__(self, concurrency: int, stale_after: timedelta, max_attempts: int):
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+        self._running: set[str] = set()
+        self.stats = {"completed": 0, "failed": 0, "requeued": 0}
+
+    def submit(self, user_id: str, platform: str, novelty_level: float, custom_prompt_override: str | None) -> str:
+        job_id = str(uuid.uuid4())
+        with Session(engine) as session:
+            session.add(GenerationJob(
+                id=job_id,
+                user_id=user_id,
+                platform=platform,
+                novelty_level=novelty_level,
+                custom_prompt_override=custom_prompt_override,
+            ))
+            session.commit()
+        self._wake.set()
+        return job_id
+
+    def _claim(self) -> str | None:
+        """Mark the oldest queued job as running by this process; None when nothing is queued."""
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            candidates = session.exec(
+                select(GenerationJob.id, GenerationJob.attempts)
+                .where(GenerationJob.status == "queued")
+                .order_by(GenerationJob.created_at)
+                .limit(8)
+            ).all()
+            for job_id, attempts in candidates:
+                if attempts >= self.max_attempts:
+                    _fail(job_id, "Generation failed: interrupted too many times")
+                    continue
+                result = session.exec(
+                    update(GenerationJob)
+                    .where(GenerationJob.id == job_id, GenerationJob.status == "queued")
+                    .values(status="running", owner=_OWNER, heartbeat_at=now, updated_at=now, attempts=GenerationJob.attempts + 1)
+                )
+                session.commit()
+                if result.rowcount == 1:
+                    return job_id
+        return None
+
+    def _release(self, job_id: str, attempts: int) -> bool:
+        """Hand an interrupted job back to the queue, or fail it once it has used up its attempts."""
+        if attempts >= self.max_attempts:
+            _fail(job_id, "Generation failed: interrupted too many times")
+            return False
+        _update(job_id, status="queued", owner=None)
+        return True
+
+    def sweep(self) -> int:
+        """Re-queue running jobs whose heartbeat stopped, failing those out of attempts; returns how many."""
+        cutoff = datetime.utcnow() - self.stale_after
+        with Session(engine) as session:
+            stale = session.exec(
+                select(GenerationJob).where(GenerationJob.status == "running", GenerationJob.heartbeat_at < cutoff)
+            ).all()
+            stale = [(job.id, job.attempts) for job in stale]
+        for job_id, attempts in stale:
+            if self._release(job_id, attempts):
+                self.stats["requeued"] += 1
+        if stale:
+            self._wake.set()
+        return len(stale)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            _update(job_id, heartbeat_at=datetime.utcnow())
+
+    async def _execute(self, job_id: str):
+        self._running.add(job_id)
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            await _run(job_id)
+        except SunoError as e:
+            print(f"[generate] job {job_id} SunoError: {e}", flush=True)
+            message = str(e)
+        except RateLimitShed as e:
+            print(f"[generate] job {job_id}: Spotify rate budget exhausted: {e}", flush=True)
+            message = "Spotify is busy, please try again shortly"
+        except Exception as e:
+            print(f"[generate] job {job_id} EXCEPTION: {e}\n{traceback.format_exc()}", flush=True)
+            message = f"Generation failed: {str(e)}"
+        else:
+            _update(job_id, status="done")
+            self.stats["completed"] += 1
+            return
+        finally:
+            heartbeat.cancel()
+            self._running.discard(job_id)
+        _fail(job_id, message)
+        self.stats["failed"] += 1
+
+    async def _work(self):
+        while True:
+            try:
+                self._wake.clear()
+                job_id = self._claim()
+                if job_id is None:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=SWEEP_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._execute(job_id)
+            except Exception as exc:
+                # A job left running here has no heartbeat any more, so the sweep re-queues it.
+                print(f"[generate] worker error: {exc!r}", flush=True)
+                await asyncio.sleep(WORKER_ERROR_BACKOFF)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                requeued = self.sweep()
+                if requeued:
+                    print(f"[generate] re-queued {requeued} interrupted generation jobs", flush=True)
+            except Exception as exc:
+                print(f"[generate] job sweep failed: {exc!r}", flush=True)
+            await asyncio.sleep(SWEEP_INTERVAL)
+
+    def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweep_loop()))
+
+    async def stop(self):
+        """Stop the workers and hand their unfinished jobs back to the queue for the next start."""
+        interrupted = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with Session(engine) as session:
+            attempts = dict(session.exec(
+                select(GenerationJob.id, GenerationJob.attempts).where(GenerationJob.id.in_(interrupted))
+            ).all())
+        for job_id in interrupted:
+            self._release(job_id, attempts.get(job_id, 0))
+
+    def snapshot(self) -> dict:
+        with Session(engine) as session:
+            queued = session.exec(select(func.count()).where(GenerationJob.status == "queued")).one()
+        return {"workers": self.concurrency, "running": len(self._running), "queued": queued, **self.stats}
+
+
+generation_workers = GenerationWorkers(GENERATION_WORKERS, GENERATION_JOB_STALE, GENERATION_MAX_ATTEMPTS)
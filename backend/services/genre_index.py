@@ -0,0 +1,170 @@
+"""Offline MusicBrainz genre index.
+
+Builds a compact SQLite file mapping normalised artist names and aliases to their top tags, so
+genre fallback can be answered locally instead of through live MusicBrainz calls.
+
+    python -m services.genre_index import /data/mbdump/artist.tar.xz
+    python -m services.genre_index import artists.tsv --format tsv
+    python -m services.genre_index lookup "Radiohead"
+
+Accepted inputs:
+- MusicBrainz JSON dump: the `artist.tar.xz` archive or its extracted `mbdump/artist` file, one
+  JSON artist per line (optionally .gz/.xz/.bz2 compressed).
+- TSV: `name<TAB>alias|alias<TAB>tag:count;tag:count`, one artist per line.
+"""
+import argparse
+import bz2
+import contextlib
+import gzip
+import json
+import lzma
+import os
+import sqlite3
+import sys
+import tarfile
+import time
+
+GENRE_INDEX_PATH = os.getenv("GENRE_INDEX_PATH", "./genre_index.sqlite")
+MAX_TAGS = 10
+BATCH_SIZE = 10_000
+
+_conn: sqlite3.Connection | None = None
+_conn_mtime: float | None = None
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def _connection() -> sqlite3.Connection | None:
+    """Read-only connection to the index, reopened when an import replaces the file."""
+    global _conn, _conn_mtime
+    try:
+        mtime = os.stat(GENRE_INDEX_PATH).st_mtime
+    except OSError:
+        return None
+    if _conn is None or mtime != _conn_mtime:
+        if _conn is not None:
+            _conn.close()
+        _conn = sqlite3.connect(f"file:{GENRE_INDEX_PATH}?mode=ro", uri=True, check_same_thread=False)
+        _conn_mtime = mtime
+    return _conn
+
+
+def lookup_tags(artist_name: str) -> list[tuple[str, int]] | None:
+    """Top (tag, count) pairs for an artist, or None if the index is missing or has no entry."""
+    conn = _connection()
+    if conn is None:
+        return None
+    row = conn.execute("SELECT tags FROM artist_tags WHERE name_key = ?", (normalize_name(artist_name),)).fetchone()
+    return [tuple(t) for t in json.loads(row[0])] if row else None
+
+
+@contextlib.contextmanager
+def _open_text(path: str):
+    """Text lines of a dump, closing the file (or archive) when done.
+
+    Archives are read as a stream, stopping at the first mbdump/artist member, so a multi-GB
+    tar.xz is decompressed once and only up to the end of that member.
+    """
+    if not tarfile.is_tarfile(path):
+        openers = {".gz": gzip.open, ".xz": lzma.open, ".bz2": bz2.open}
+        opener = openers.get(os.path.splitext(path)[1], open)
+        with opener(path, "rt", encoding="utf-8") as lines:
+            yield lines
+        return
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if member.isfile() and member.name.endswith("mbdump/artist"):
+                # Stream members are not seekable, which io.TextIOWrapper requires, so decode per line.
+                yield (line.decode("utf-8") for line in archive.extractfile(member))
+                return
+    raise SystemExit(f"{path}: no mbdump/artist member in archive")
+
+
+def _parse_json(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        artist = json.loads(line)
+        tags = artist.get("tags") or artist.get("genres") or []
+        names = [artist.get("name", "")] + [a.get("name", "") for a in artist.get("aliases") or []]
+        yield names, [(t["name"], int(t.get("count", 0))) for t in tags]
+
+
+def _parse_tsv(lines):
+    for line in lines:
+        fields = line.rstrip("\n").split("\t")
+        if len(fields) < 3:
+            continue
+        name, aliases, tag_field = fields[:3]
+        tags = []
+        for item in filter(None, tag_field.split(";")):
+            tag, _, count = item.rpartition(":")
+            tags.append((tag, int(count)) if tag and count.isdigit() else (item, 1))
+        yield [name] + aliases.split("|"), tags
+
+
+def build_index(dump_path: str, output_path: str, fmt: str) -> int:
+    tmp_path = f"{output_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE artist_tags (name_key TEXT PRIMARY KEY, tags TEXT NOT NULL, score INTEGER NOT NULL) WITHOUT ROWID")
+
+    # A shared name or alias keeps the artist with the most tag votes, like MusicBrainz search ranking.
+    upsert = (
+        "INSERT INTO artist_tags (name_key, tags, score) VALUES (?, ?, ?) "
+        "ON CONFLICT(name_key) DO UPDATE SET tags = excluded.tags, score = excluded.score "
+        "WHERE excluded.score > artist_tags.score"
+    )
+    parse = _parse_tsv if fmt == "tsv" else _parse_json
+    artists = 0
+    batch = []
+    with _open_text(dump_path) as lines:
+        for names, tags in parse(lines):
+            tags = sorted((t for t in tags if t[1] >= 1), key=lambda t: t[1], reverse=True)[:MAX_TAGS]
+            if not tags:
+                continue
+            artists += 1
+            payload = json.dumps([[name, count] for name, count in tags], separators=(",", ":"))
+            score = sum(count for _, count in tags)
+            for key in {normalize_name(n) for n in names if n and n.strip()}:
+                batch.append((key, payload, score))
+            if len(batch) >= BATCH_SIZE:
+                conn.executemany(upsert, batch)
+                batch.clear()
+    if batch:
+        conn.executemany(upsert, batch)
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, output_path)
+    return artists
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m services.genre_index", description="Offline MusicBrainz genre index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("import", help="build the index from a dump file")
+    build.add_argument("dump")
+    build.add_argument("--format", choices=["json", "tsv"], default="json")
+    build.add_argument("--output", default=GENRE_INDEX_PATH)
+    query = sub.add_parser("lookup", help="look up one artist")
+    query.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        started = time.perf_counter()
+        count = build_index(args.dump, args.output, args.format)
+        size_mb = os.path.getsize(args.output) / 1_000_000
+        print(f"[genre_index] indexed {count} tagged artists into {args.output} ({size_mb:.1f} MB) in {time.perf_counter() - started:.1f}s")
+    else:
+        tags = lookup_tags(args.name)
+        print(json.dumps(tags) if tags is not None else "not found")
+        sys.exit(0 if tags is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,31 @@
 import asyncio
+import json
 import logging
+import os
+import threading
 import time
 from concurrent.futures import ThreadPoolExecutor
-from functools import lru_cache
+from datetime import datetime, timedelta
 
 import musicbrainzngs
+from sqlmodel import Session, select
+
+from db import CachedGenreLookup, engine
+from services.cache import TTLCache
+from services.genre_index import lookup_tags, normalize_name
 
 logging.getLogger("musicbrainzngs").setLevel(logging.WARNING)
 
 musicbrainzngs.set_useragent("Reso", "0.1.0", "https://github.com/yourusername/reso")
 
-_executor = ThreadPoolExecutor(max_workers=2)
+MUSICBRAINZ_MIN_INTERVAL = float(os.getenv("MUSICBRAINZ_MIN_INTERVAL", "1.1"))
+MUSICBRAINZ_DEADLINE = float(os.getenv("MUSICBRAINZ_DEADLINE", "8"))
+
+GENRE_CACHE_TTL = timedelta(days=int(os.getenv("GENRE_CACHE_TTL_DAYS", "30")))
+GENRE_CACHE_NEGATIVE_TTL = timedelta(days=int(os.getenv("GENRE_CACHE_NEGATIVE_TTL_DAYS", "3")))
+GENRE_CACHE_SIZE = int(os.getenv("GENRE_CACHE_SIZE", "10000"))
+
+_warm = TTLCache(GENRE_CACHE_SIZE)
 
 TAG_REMAP = {
     "hip-hop": "hip hop",
@@ -28,9 +43,34 @@ def _clean_tag(tag: str) -> str:
     return TAG_REMAP.get(t, t)
 
 
+class _Pacer:
+    """Spaces calls at least `interval` seconds apart across every thread in the process."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                time.sleep(self._next - now)
+            self._next = max(now, self._next) + self.interval
+
+
+_pacer = _Pacer(MUSICBRAINZ_MIN_INTERVAL)
+
+
+def _top_genres(tags: list[tuple[str, int]]) -> list[str]:
+    ranked = sorted(tags, key=lambda t: t[1], reverse=True)
+    return [_clean_tag(name) for name, count in ranked[:6] if count >= 1]
+
+
 def _mb_call_with_retry(fn, *args, retries=2, **kwargs):
     for attempt in range(retries + 1):
         try:
+            _pacer.wait()
             return fn(*args, **kwargs)
         except Exception as e:
             if attempt < retries and ("SSL" in str(e) or "urlopen error" in str(e) or "EOF" in str(e)):
@@ -39,8 +79,60 @@ def _mb_call_with_retry(fn, *args, retries=2, **kwargs):
             raise
 
 
-@lru_cache(maxsize=256)
-def _search_artist_genres(artist_name: str) -> list[str]:
+def _ttl_for(genres: list[str]) -> timedelta:
+    # An empty list is a cached "no result", kept for a shorter time than real genres.
+    return GENRE_CACHE_TTL if genres else GENRE_CACHE_NEGATIVE_TTL
+
+
+def get_cached_genres(artist_names: list[str]) -> tuple[dict[str, list[str]], list[str]]:
+    """Split names into ({name: genres} known to the warm tier or DB, [names never looked up or expired])."""
+    found: dict[str, list[str]] = {}
+    cold: dict[str, list[str]] = {}
+    for name in artist_names:
+        genres = _warm.get(normalize_name(name))
+        if genres is not None:
+            found[name] = list(genres)
+        else:
+            cold.setdefault(normalize_name(name), []).append(name)
+
+    if cold:
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            rows = session.exec(select(CachedGenreLookup).where(CachedGenreLookup.name_key.in_(list(cold))))
+            for row in rows:
+                genres = json.loads(row.genres)
+                remaining = _ttl_for(genres) - (now - row.fetched_at)
+                if remaining.total_seconds() <= 0:
+                    continue
+                _warm.set(row.name_key, genres, remaining.total_seconds())
+                for name in cold[row.name_key]:
+                    found[name] = list(genres)
+
+    unknown = [name for name in dict.fromkeys(artist_names) if name not in found]
+    return found, unknown
+
+
+def store_genres(results: dict[str, list[str]]):
+    if not results:
+        return
+    now = datetime.utcnow()
+    by_key = {normalize_name(name): genres for name, genres in results.items()}
+    with Session(engine) as session:
+        existing = {
+            row.name_key: row
+            for row in session.exec(select(CachedGenreLookup).where(CachedGenreLookup.name_key.in_(list(by_key))))
+        }
+        for key, genres in by_key.items():
+            row = existing.get(key) or CachedGenreLookup(name_key=key)
+            row.genres = json.dumps(genres)
+            row.fetched_at = now
+            session.add(row)
+            _warm.set(key, genres, _ttl_for(genres).total_seconds())
+        session.commit()
+
+
+def _search_artist_genres(artist_name: str) -> list[str] | None:
+    """Live MusicBrainz lookup. Returns [] when MusicBrainz has no genres, None when the lookup failed."""
     try:
         result = _mb_call_with_retry(musicbrainzngs.search_artists, artist=artist_name, limit=1)
         artists = result.get("artist-list", [])
@@ -50,21 +142,84 @@ def _search_artist_genres(artist_name: str) -> list[str]:
         artist_id = artists[0]["id"]
         detail = _mb_call_with_retry(musicbrainzngs.get_artist_by_id, artist_id, includes=["tags"])
         tags = detail.get("artist", {}).get("tag-list", [])
-        ranked = sorted(tags, key=lambda t: int(t.get("count", 0)), reverse=True)
-        return [_clean_tag(t["name"]) for t in ranked[:6] if int(t.get("count", 0)) >= 1]
+        return _top_genres([(t["name"], int(t.get("count", 0))) for t in tags])
     except Exception as e:
         print(f"[musicbrainz] error looking up '{artist_name}': {e}", flush=True)
-        return []
-
-
-async def lookup_genres_batch(artist_names: list[str]) -> dict[str, list[str]]:
-    """Look up genres for a batch of artists via MusicBrainz. Returns {name: [genres]}."""
-    loop = asyncio.get_event_loop()
-    results: dict[str, list[str]] = {}
-
-    for name in artist_names:
-        genres = await loop.run_in_executor(_executor, _search_artist_genres, name)
-        results[name] = genres
-        await asyncio.sleep(1.1)
-
+        return None
+
+
+class MusicBrainzScheduler:
+    """Single owner of the process-wide MusicBrainz budget.
+
+    Lookups run one at a time on a dedicated thread, with every MusicBrainz call paced by
+    `_pacer`. Concurrent requests for the same artist share one in-flight future, and results
+    are written to the genre store as they land, even if the caller that asked stopped waiting.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="musicbrainz")
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    def submit(self, artist_name: str) -> asyncio.Future:
+        key = normalize_name(artist_name)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, _search_artist_genres, artist_name)
+            future.add_done_callback(lambda f, key=key: self._finish(key, f))
+            self._inflight[key] = future
+        return future
+
+    def _finish(self, key: str, future: asyncio.Future):
+        self._inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        genres = future.result()
+        if genres is not None:
+            store_genres({key: genres})
+
+    @property
+    def pending(self) -> int:
+        return len(self._inflight)
+
+
+scheduler = MusicBrainzScheduler()
+
+
+async def lookup_genres_batch(artist_names: list[str], deadline: float | None = None) -> dict[str, list[str]]:
+    """Look up genres for a batch of artists: offline index first, then the store, then MusicBrainz.
+
+    Returns {name: [genres]}. With a deadline (seconds), names still queued when it passes are
+    left out of the result; their lookups keep running and land in the store for next time.
+    """
+    indexed: dict[str, list[str]] = {}
+    not_indexed = []
+    for name in dict.fromkeys(artist_names):
+        tags = lookup_tags(name)
+        if tags is not None:
+            indexed[name] = _top_genres(tags)
+        else:
+            not_indexed.append(name)
+
+    results, unknown = get_cached_genres(not_indexed)
+    results.update(indexed)
+    print(
+        f"[musicbrainz] {len(indexed)} from offline index, {len(results) - len(indexed)} cached, "
+        f"{len(unknown)} to look up ({scheduler.pending} already in flight)",
+        flush=True,
+    )
+    if not unknown:
+        return results
+
+    futures = {name: scheduler.submit(name) for name in unknown}
+    # shield() so that a caller giving up never cancels a lookup other callers are sharing.
+    waiters = {asyncio.shield(future): name for name, future in futures.items()}
+    done, pending = await asyncio.wait(waiters, timeout=deadline)
+    for waiter in pending:
+        waiter.cancel()
+    for waiter in done:
+        if not waiter.cancelled() and waiter.exception() is None:
+            results[waiters[waiter]] = waiter.result() or []
+    if pending:
+        print(f"[musicbrainz] deadline hit, returning without {len(pending)} artists", flush=True)
     return results
@@ -0,0 +1,86 @@
+import os
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# suno-api is a Next.js server speaking plain HTTP/1.1, so only the Spotify pools negotiate HTTP/2.
+POOLS = {
+    "spotify": {"http2": True, "timeout": 15.0},
+    "spotify_accounts": {"http2": True, "timeout": 15.0},
+    "suno": {"http2": False, "timeout": 30.0},
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _pool_setting(name: str, key: str, default):
+    value = os.getenv(f"HTTP_{name.upper()}_{key}")
+    return type(default)(value) if value is not None else default
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    config = POOLS[name]
+    limits = httpx.Limits(
+        max_connections=_pool_setting(name, "MAX_CONNECTIONS", HTTP_MAX_CONNECTIONS),
+        max_keepalive_connections=_pool_setting(name, "MAX_KEEPALIVE", HTTP_MAX_KEEPALIVE),
+        keepalive_expiry=_pool_setting(name, "KEEPALIVE_EXPIRY", HTTP_KEEPALIVE_EXPIRY),
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=config["timeout"],
+        http2=config["http2"] and HTTP2_ENABLED and HTTP2_AVAILABLE,
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Return the shared client for an upstream, creating it on first use (e.g. from CLI scripts)."""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
+
+
+async def start_clients():
+    for name in POOLS:
+        get_client(name)
+    print(f"[http] started pools {list(POOLS)} (http2={'on' if HTTP2_ENABLED and HTTP2_AVAILABLE else 'off'})", flush=True)
+
+
+async def close_clients():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def pool_stats() -> dict:
+    """Connection and queue counts per pool, read from the underlying httpcore pool."""
+    stats = {}
+    for name, client in _clients.items():
+        pool = getattr(client._transport, "_pool", None)
+        if pool is None:
+            continue
+        connections = list(pool.connections)
+        requests = list(getattr(pool, "_requests", []))
+        queued = sum(1 for r in requests if r.is_queued())
+        stats[name] = {
+            "max_connections": pool._max_connections,
+            "connections": len(connections),
+            "active": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "idle": sum(1 for c in connections if c.is_idle()),
+            "in_flight": len(requests) - queued,
+            "queued": queued,
+            "http2": getattr(pool, "_http2", False),
+        }
+    return stats
@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, func, select
+
+from db import ListeningEvent, engine
+from services.spotify import SpotifyClient
+
+LISTENING_HISTORY_LIMIT = int(os.getenv("LISTENING_HISTORY_LIMIT", "250"))
+LISTENING_HISTORY_DAYS = int(os.getenv("LISTENING_HISTORY_DAYS", "30"))
+LISTENING_RETENTION_DAYS = int(os.getenv("LISTENING_RETENTION_DAYS", "180"))
+MAX_INGEST_PAGES = 5
+
+
+def _parse_played_at(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _to_ms(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _compact_track(track: dict) -> dict:
+    """Keep only the fields extract_track_meta reads, in Spotify's own shape."""
+    album = track.get("album") or {}
+    return {
+        "id": track.get("id"),
+        "name": track.get("name"),
+        "artists": [{"id": a.get("id"), "name": a.get("name")} for a in track.get("artists", [])],
+        "album": {"name": album.get("name"), "release_date": album.get("release_date", "")},
+        "popularity": track.get("popularity", 0),
+        "duration_ms": track.get("duration_ms", 0),
+        "explicit": track.get("explicit", False),
+    }
+
+
+def latest_play(user_id: str, session: Session) -> datetime | None:
+    return session.exec(select(func.max(ListeningEvent.played_at)).where(ListeningEvent.user_id == user_id)).one()
+
+
+async def ingest_recently_played(spotify: SpotifyClient, user_id: str) -> int:
+    """Store plays newer than the latest stored one, using Spotify's `after` cursor. Returns the number of new events."""
+    with Session(engine) as session:
+        last = latest_play(user_id, session)
+    after_ms = _to_ms(last) + 1 if last else None
+
+    events: dict[datetime, ListeningEvent] = {}
+    try:
+        for _ in range(MAX_INGEST_PAGES):
+            data = await spotify.get_recently_played_after(after_ms)
+            items = data.get("items", [])
+            for item in items:
+                if not item.get("played_at") or not item.get("track"):
+                    continue
+                played_at = _parse_played_at(item["played_at"])
+                events[played_at] = ListeningEvent(
+                    user_id=user_id,
+                    played_at=played_at,
+                    track_id=item["track"].get("id") or "",
+                    track_json=json.dumps(_compact_track(item["track"]), separators=(",", ":")),
+                )
+            cursor = (data.get("cursors") or {}).get("after")
+            if not items or not data.get("next") or not cursor or int(cursor) <= (after_ms or 0):
+                break
+            after_ms = int(cursor)
+    except httpx.HTTPStatusError as e:
+        print(f"[listening] recently-played ingest failed with {e.response.status_code}, keeping what was fetched", flush=True)
+
+    if not events:
+        return 0
+    with Session(engine) as session:
+        # Re-delivered plays are skipped so re-running an ingest is harmless.
+        existing = set(session.exec(
+            select(ListeningEvent.played_at).where(
+                ListeningEvent.user_id == user_id,
+                ListeningEvent.played_at.in_(list(events)),
+            )
+        ))
+        fresh = [e for played_at, e in events.items() if played_at not in existing]
+        session.add_all(fresh)
+        session.exec(delete(ListeningEvent).where(
+            ListeningEvent.user_id == user_id,
+            ListeningEvent.played_at < datetime.utcnow() - timedelta(days=LISTENING_RETENTION_DAYS),
+        ))
+        try:
+            session.commit()
+        except IntegrityError:
+            # A concurrent ingest for the same user stored these plays first.
+            session.rollback()
+            fresh = []
+    print(f"[listening] stored {len(fresh)} new plays for {user_id}", flush=True)
+    return len(fresh)
+
+
+def load_listening_history(user_id: str, session: Session, after: datetime | None = None) -> list[dict]:
+    """Most recent stored plays as Spotify-shaped tracks, newest first, optionally only those after `after`."""
+    since = datetime.utcnow() - timedelta(days=LISTENING_HISTORY_DAYS)
+    query = select(ListeningEvent.track_json).where(ListeningEvent.user_id == user_id, ListeningEvent.played_at >= since)
+    if after is not None:
+        query = query.where(ListeningEvent.played_at > after)
+    rows = session.exec(query.order_by(ListeningEvent.played_at.desc()).limit(LISTENING_HISTORY_LIMIT))
+    return [json.loads(row) for row in rows]
+
+
+def history_source(spotify: SpotifyClient, user_id: str, after: datetime | None = None):
+    """recently_played_source for fetch_all_data: ingest the delta, then read the stored history.
+
+    With `after`, only plays newer than it are read, e.g. those not yet folded into a TasteState.
+    Falls back to the live endpoint when nothing is stored yet (e.g. the first ingest failed).
+    """
+    async def load() -> list[dict]:
+        await ingest_recently_played(spotify, user_id)
+        with Session(engine) as session:
+            if latest_play(user_id, session) is None:
+                stored = None
+            else:
+                stored = load_listening_history(user_id, session, after)
+        return stored if stored is not None else await spotify.get_recently_played()
+
+    return load
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, delete, or_, update
+
+from db import ProfileBuildLock, User, engine
+from services.analyzer import TasteProfile, TasteState
+from services.cache import TTLCache
+from services.listening import history_source, latest_play
+from services.prompt_pool import invalidate as invalidate_prompts
+from services.records import ARTIST_SOURCES, TRACK_SOURCES
+from services.rate_limit import BACKGROUND, INTERACTIVE
+from services.spotify import SpotifyClient
+from services.token_refresh import token_refresher
+
+PROFILE_FRESH = timedelta(seconds=int(os.getenv("PROFILE_FRESH_SECONDS", "3600")))
+PROFILE_MAX_STALE = timedelta(seconds=int(os.getenv("PROFILE_MAX_STALE_SECONDS", str(7 * 24 * 3600))))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "5000"))
+PROFILE_DB_LOCK = os.getenv("PROFILE_DB_LOCK", "false").lower() in ("1", "true", "yes")
+PROFILE_DB_LOCK_TTL = timedelta(seconds=int(os.getenv("PROFILE_DB_LOCK_TTL_SECONDS", "120")))
+PROFILE_DB_LOCK_POLL = 0.5
+# User.last_seen_at is written at most this often per user.
+LAST_SEEN_RESOLUTION = timedelta(minutes=15)
+PROFILE_HISTORY_HALF_LIFE = timedelta(days=float(os.getenv("PROFILE_HISTORY_HALF_LIFE_DAYS", "7")))
+# Spotify's current view of the user, counted afresh on every build; plays are folded into User.profile_state.
+SNAPSHOT_SOURCES = tuple(s for s in TRACK_SOURCES + ARTIST_SOURCES if s != "recently_played")
+
+# user_id -> (TasteProfile, computed_at); computed_at is None once invalidated.
+_memory = TTLCache(PROFILE_CACHE_SIZE)
+_building: dict[str, asyncio.Task] = {}
+stats = {
+    "memory_hits": 0,
+    "db_hits": 0,
+    "stale": 0,
+    "misses": 0,
+    "revalidated": 0,
+    "revalidate_failed": 0,
+    "coalesced": 0,
+    "coalesced_db": 0,
+}
+_LOCK_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _remember(user_id: str, profile: TasteProfile, computed_at: datetime | None):
+    _memory.set(user_id, (profile, computed_at), PROFILE_MAX_STALE.total_seconds())
+
+
+def _from_db(user: User) -> tuple[TasteProfile, datetime | None] | None:
+    if not user.profile_cache:
+        return None
+    profile = TasteProfile(**json.loads(user.profile_cache))
+    return profile, user.profile_cache_at
+
+
+def _saved_history(user_id: str) -> TasteState | None:
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        state_json = user.profile_state if user else None
+    return TasteState.model_validate_json(state_json) if state_json else None
+
+
+async def _compute(user_id: str, priority: str) -> TasteProfile:
+    """Rebuild the profile from Spotify's current snapshot plus the user's decayed listening history.
+
+    Top tracks, saved tracks and top artists are snapshots and are counted afresh each time. Stored
+    plays are folded into User.profile_state instead: the saved state is decayed by
+    PROFILE_HISTORY_HALF_LIFE and only plays newer than its last_event_at are added to it.
+    """
+    history = _saved_history(user_id)
+    access_token = await token_refresher.access_token(user_id)
+    spotify = SpotifyClient(access_token, priority=priority)
+    after = history.last_event_at if history else None
+    library = await spotify.fetch_library(recently_played_source=history_source(spotify, user_id, after))
+
+    # Everything after the fetch is CPU work plus one read and one write, all in a single session.
+    with Session(engine) as session:
+        now = datetime.utcnow()
+        last_event_at = latest_play(user_id, session)
+        if history is not None:
+            history = history.decayed(PROFILE_HISTORY_HALF_LIFE, now)
+        if last_event_at is None:
+            # Nothing stored, so recently_played came from the live endpoint and is only a snapshot.
+            snapshot = TasteState.from_library(library, now)
+        else:
+            plays = TasteState.from_library(library, now, sources=("recently_played",))
+            plays.last_event_at = last_event_at
+            history = history.merge(plays) if history is not None else plays
+            snapshot = TasteState.from_library(library, now, sources=SNAPSHOT_SOURCES)
+        profile = (history.merge(snapshot) if history is not None else snapshot).to_profile()
+
+        computed_at = datetime.utcnow()
+        profile_json = profile.model_dump_json()
+        user = session.get(User, user_id)
+        if user is None:
+            raise LookupError(f"user {user_id} not found")
+        if profile_json != user.profile_cache:
+            invalidate_prompts(user_id)
+        user.profile_cache = profile_json
+        user.profile_cache_at = computed_at
+        if history is not None:
+            user.profile_state = history.model_dump_json()
+        session.add(user)
+        session.commit()
+    if profile.top_genres:
+        _remember(user_id, profile, computed_at)
+    return profile
+
+
+def _try_db_lock(user_id: str) -> bool:
+    now = datetime.utcnow()
+    expires_at = now + PROFILE_DB_LOCK_TTL
+    with Session(engine) as session:
+        session.add(ProfileBuildLock(user_id=user_id, owner=_LOCK_OWNER, expires_at=expires_at))
+        try:
+            session.commit()
+            return True
+        except IntegrityError:
+            session.rollback()
+        # Held already; take it over only if the holder let it expire (e.g. the worker died).
+        result = session.exec(
+            update(ProfileBuildLock)
+            .where(ProfileBuildLock.user_id == user_id, ProfileBuildLock.expires_at < now)
+            .values(owner=_LOCK_OWNER, expires_at=expires_at)
+        )
+        session.commit()
+        return result.rowcount == 1
+
+
+def _release_db_lock(user_id: str):
+    with Session(engine) as session:
+        session.exec(delete(ProfileBuildLock).where(ProfileBuildLock.user_id == user_id, ProfileBuildLock.owner == _LOCK_OWNER))
+        session.commit()
+
+
+def _built_since(user_id: str, since: datetime) -> TasteProfile | None:
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+        entry = _from_db(user) if user else None
+    if entry is None or entry[1] is None or entry[1] < since:
+        return None
+    if entry[0].top_genres:
+        _remember(user_id, *entry)
+    return entry[0]
+
+
+async def _compute_with_db_lock(user_id: str, priority: str) -> TasteProfile:
+    """Build under a per-user row lock, or reuse the result of another worker that held it."""
+    started = datetime.utcnow()
+    while not _try_db_lock(user_id):
+        await asyncio.sleep(PROFILE_DB_LOCK_POLL)
+        profile = _built_since(user_id, started)
+        if profile is not None:
+            stats["coalesced_db"] += 1
+            return profile
+    try:
+        return await _compute(user_id, priority)
+    finally:
+        _release_db_lock(user_id)
+
+
+def _build_done(user_id: str, task: asyncio.Task):
+    if _building.get(user_id) is task:
+        del _building[user_id]
+    if not task.cancelled():
+        task.exception()
+
+
+def _start_build(user_id: str, priority: str = INTERACTIVE) -> asyncio.Task:
+    task = _building.get(user_id)
+    if task is not None:
+        stats["coalesced"] += 1
+        return task
+    compute = _compute_with_db_lock if PROFILE_DB_LOCK else _compute
+    task = _building[user_id] = asyncio.create_task(compute(user_id, priority))
+    task.add_done_callback(lambda t: _build_done(user_id, t))
+    return task
+
+
+async def build_profile(user_id: str, priority: str = INTERACTIVE) -> TasteProfile:
+    """Fetch from Spotify, rebuild the user's profile and write it to both cache tiers.
+
+    `priority` is the Spotify rate-budget priority; a build joined by a later caller keeps the
+    priority it was started with.
+
+    Concurrent calls for the same user share one build and its result (or error). With
+    PROFILE_DB_LOCK set, builds are also serialised across workers through ProfileBuildLock, and
+    a worker that waited on another one returns the profile that worker stored.
+    """
+    return await asyncio.shield(_start_build(user_id, priority))
+
+
+def _revalidated(user_id: str, task: asyncio.Task):
+    if task.cancelled():
+        return
+    if task.exception() is None:
+        stats["revalidated"] += 1
+    else:
+        stats["revalidate_failed"] += 1
+        print(f"[profiles] background revalidation for {user_id} failed: {task.exception()!r}", flush=True)
+
+
+def _revalidate(user_id: str):
+    if user_id in _building:
+        return
+    _start_build(user_id, BACKGROUND).add_done_callback(lambda t: _revalidated(user_id, t))
+
+
+def _mark_seen(user: User):
+    """Record that the user made a request, which is what the refresh worker selects users by."""
+    now = datetime.utcnow()
+    if user.last_seen_at is not None and user.last_seen_at >= now - LAST_SEEN_RESOLUTION:
+        return
+    with Session(engine) as session:
+        session.exec(
+            update(User)
+            .where(User.id == user.id, or_(User.last_seen_at.is_(None), User.last_seen_at < now - LAST_SEEN_RESOLUTION))
+            .values(last_seen_at=now)
+        )
+        session.commit()
+
+
+async def get_profile(user_id: str) -> TasteProfile:
+    """The user's TasteProfile from the in-process LRU, then the DB, then Spotify.
+
+    Profiles younger than PROFILE_FRESH are returned as is. Older ones, up to PROFILE_MAX_STALE,
+    are returned immediately while a background task rebuilds them. Anything older, or a profile
+    without genres, is rebuilt before returning.
+
+    A DB row written after the in-memory entry, e.g. by the refresh worker or another process,
+    replaces it. Raises LookupError for an unknown user.
+    """
+    with Session(engine) as session:
+        user = session.get(User, user_id)
+    if user is None:
+        raise LookupError(f"user {user_id} not found")
+    _mark_seen(user)
+    entry = _memory.get(user.id)
+    tier = "memory_hits"
+    stored_at = user.profile_cache_at
+    if entry is None or (stored_at is not None and (entry[1] is None or stored_at > entry[1])):
+        stored = _from_db(user)
+        if stored is not None:
+            entry, tier = stored, "db_hits"
+            if entry[0].top_genres:
+                _remember(user.id, *entry)
+
+    if entry is not None and entry[0].top_genres:
+        profile, computed_at = entry
+        age = datetime.utcnow() - computed_at if computed_at else PROFILE_FRESH
+        if age < PROFILE_FRESH:
+            stats[tier] += 1
+            return profile
+        if age < PROFILE_MAX_STALE:
+            stats["stale"] += 1
+            _revalidate(user.id)
+            return profile
+
+    stats["misses"] += 1
+    return await build_profile(user.id)
+
+
+def invalidate(user_id: str):
+    """Mark a user's cached profile as outdated, e.g. after re-login.
+
+    The next read still serves it, but as stale, so it is rebuilt in the background.
+    """
+    entry = _memory.pop(user_id)
+    if entry is not None:
+        _remember(user_id, entry[0], None)
+
+
+def cache_stats() -> dict:
+    return {"size": len(_memory), "building": len(_building), **stats}
@@ -1,5 +1,6 @@
 import json
 import os
+import time
 
 import anthropic
 
@@ -28,26 +29,165 @@ Return ONLY valid JSON in this format:
 }"""
 
 
-async def generate_prompts(profile: TasteProfile, novelty_level: float = 0.2) -> dict:
-    client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+MODEL = "claude-sonnet-4-6"
+
+# The system prompt is identical on every call, so it is sent as a cacheable block. The API only
+# caches prefixes above a model-specific minimum (1024 tokens for Sonnet); below that the marker is
+# ignored and cache_read_input_tokens stays 0, which usage_stats makes visible.
+SYSTEM_BLOCKS = [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}]
+
+_client: anthropic.AsyncAnthropic | None = None
+usage_stats = {
+    "calls": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_creation_input_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_hits": 0,
+}
+
+
+def get_anthropic_client() -> anthropic.AsyncAnthropic:
+    """The shared Anthropic client, created on first use. ANTHROPIC_BASE_URL overrides the endpoint."""
+    global _client
+    if _client is None:
+        _client = anthropic.AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+        )
+    return _client
+
+
+async def close_anthropic_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def _record_usage(usage, elapsed: float):
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    usage_stats["calls"] += 1
+    usage_stats["input_tokens"] += usage.input_tokens
+    usage_stats["output_tokens"] += usage.output_tokens
+    usage_stats["cache_creation_input_tokens"] += cache_write
+    usage_stats["cache_read_input_tokens"] += cache_read
+    usage_stats["cache_hits"] += 1 if cache_read else 0
+    print(
+        f"[prompt_builder] {elapsed:.2f}s input={usage.input_tokens} output={usage.output_tokens} "
+        f"cache_write={cache_write} cache_read={cache_read}",
+        flush=True,
+    )
+
 
-    user_message = (
+class PromptFieldParser:
+    """Incremental parser for the top-level fields of the JSON object Claude returns.
+
+    feed() takes text as it streams in and returns the (key, value) pairs whose values completed
+    in that chunk. Anything before the first "{" (prose, a code fence) and after the matching "}"
+    is ignored, so fences need no special handling.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.fields: dict = {}
+        self.done = False
+        self._pos = 0
+        self._start: int | None = None
+        self._member_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        completed = []
+        if self.done:
+            return completed
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            if self._start is None:
+                if ch == "{":
+                    self._start = self._pos
+                    self._member_start = self._pos + 1
+                    self._depth = 1
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            if self._start is not None and not self._in_string and (
+                (self._depth == 1 and ch == ",") or self._depth == 0
+            ):
+                member = text[self._member_start : self._pos].strip()
+                if member:
+                    completed.extend(json.loads("{" + member + "}").items())
+                self._member_start = self._pos + 1
+                if self._depth == 0:
+                    self.done = True
+                    break
+            self._pos += 1
+        self.fields.update(completed)
+        return completed
+
+
+def parse_prompt_json(text: str) -> dict:
+    """Parse Claude's reply: the first JSON object in it, wherever it starts."""
+    parser = PromptFieldParser()
+    parser.feed(text)
+    if not parser.done:
+        raise ValueError(f"no complete JSON object in model reply: {text[:200]!r}")
+    return parser.fields
+
+
+def _user_message(profile: TasteProfile, novelty_level: float) -> str:
+    return (
         f"Here is the user's musical taste profile (JSON). "
         f"Novelty dial is at {novelty_level:.1f} (0 = pure comfort zone, 1 = maximum exploration).\n\n"
         f"{profile.model_dump_json(indent=2)}"
     )
 
-    response = await client.messages.create(
-        model="claude-sonnet-4-6",
+
+async def generate_prompts(profile: TasteProfile, novelty_level: float = 0.2) -> dict:
+    started = time.perf_counter()
+    response = await get_anthropic_client().messages.create(
+        model=MODEL,
         max_tokens=600,
-        system=SYSTEM_PROMPT,
-        messages=[{"role": "user", "content": user_message}],
+        system=SYSTEM_BLOCKS,
+        messages=[{"role": "user", "content": _user_message(profile, novelty_level)}],
     )
+    _record_usage(response.usage, time.perf_counter() - started)
+    return parse_prompt_json(response.content[0].text)
 
-    text = response.content[0].text.strip()
-    if text.startswith("```"):
-        text = text.split("\n", 1)[1]
-        if text.endswith("```"):
-            text = text[:-3]
 
-    return json.loads(text)
+async def stream_prompts(profile: TasteProfile, novelty_level: float = 0.2):
+    """Streaming generate_prompts: yields (field, value) as each top-level field completes.
+
+    suno_prompt comes first in the requested format, so callers can start Suno while the
+    remaining fields are still being generated.
+    """
+    started = time.perf_counter()
+    parser = PromptFieldParser()
+    async with get_anthropic_client().messages.stream(
+        model=MODEL,
+        max_tokens=600,
+        system=SYSTEM_BLOCKS,
+        messages=[{"role": "user", "content": _user_message(profile, novelty_level)}],
+    ) as stream:
+        async for text in stream.text_stream:
+            for field in parser.feed(text):
+                yield field
+        message = await stream.get_final_message()
+    _record_usage(message.usage, time.perf_counter() - started)
+    if not parser.done:
+        raise ValueError(f"no complete JSON object in model reply: {parser.text[:200]!r}")
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict, deque
+
+from services.analyzer import TasteProfile
+from services.prompt_builder import generate_prompts
+
+PROMPT_POOL_SIZE = int(os.getenv("PROMPT_POOL_SIZE", "2"))
+PROMPT_POOL_MAX_USERS = int(os.getenv("PROMPT_POOL_MAX_USERS", "1000"))
+NOVELTY_STEP = 0.1
+
+# user_id -> {(profile_hash, novelty_bucket): deque of ready prompt dicts}, least recently used first.
+_pools: OrderedDict[str, dict[tuple[str, int], deque]] = OrderedDict()
+_refilling: dict[tuple[str, str, int], asyncio.Task] = {}
+stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0, "evicted_users": 0, "invalidated": 0}
+
+
+def profile_hash(profile: TasteProfile) -> str:
+    return hashlib.sha1(profile.model_dump_json().encode()).hexdigest()[:16]
+
+
+def novelty_bucket(novelty_level: float) -> int:
+    return round(min(max(novelty_level, 0.0), 1.0) / NOVELTY_STEP)
+
+
+def _user_pool(user_id: str, phash: str) -> dict[tuple[str, int], deque]:
+    """The user's pools, moved to most recently used; pools for any other profile hash are dropped."""
+    pool = _pools.get(user_id)
+    if pool is None:
+        pool = _pools[user_id] = {}
+        while len(_pools) > PROMPT_POOL_MAX_USERS:
+            _pools.popitem(last=False)
+            stats["evicted_users"] += 1
+    else:
+        _pools.move_to_end(user_id)
+        stale = [key for key in pool if key[0] != phash]
+        for key in stale:
+            del pool[key]
+        stats["invalidated"] += len(stale)
+    return pool
+
+
+def take(user_id: str, profile: TasteProfile, novelty_level: float) -> dict | None:
+    """Pop a ready prompt for this profile and novelty bucket, if any, and refill in the background."""
+    phash, bucket = profile_hash(profile), novelty_bucket(novelty_level)
+    ready = _user_pool(user_id, phash).get((phash, bucket))
+    prompt = ready.popleft() if ready else None
+    stats["hits" if prompt else "misses"] += 1
+    _refill(user_id, profile, phash, bucket)
+    return prompt
+
+
+def invalidate(user_id: str):
+    if _pools.pop(user_id, None) is not None:
+        stats["invalidated"] += 1
+
+
+def _refill(user_id: str, profile: TasteProfile, phash: str, bucket: int):
+    key = (user_id, phash, bucket)
+    if key in _refilling:
+        return
+
+    async def run():
+        try:
+            while True:
+                pool = _pools.get(user_id)
+                if pool is None or any(k[0] != phash for k in pool):
+                    return
+                ready = pool.setdefault((phash, bucket), deque())
+                if len(ready) >= PROMPT_POOL_SIZE:
+                    return
+                prompt = await generate_prompts(profile, bucket * NOVELTY_STEP)
+                stats["generated"] += 1
+                pool = _pools.get(user_id)
+                # The user may have been evicted or moved to a new profile while Claude was answering.
+                if pool is not None and (phash, bucket) in pool:
+                    pool[(phash, bucket)].append(prompt)
+        except Exception as exc:
+            stats["failed"] += 1
+            print(f"[prompt_pool] refill for {user_id} failed: {exc!r}", flush=True)
+        finally:
+            _refilling.pop(key, None)
+
+    _refilling[key] = asyncio.create_task(run())
+
+
+def pool_stats() -> dict:
+    ready = sum(len(q) for pool in _pools.values() for q in pool.values())
+    return {"users": len(_pools), "ready": ready, "refilling": len(_refilling), **stats}
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+
+class RateLimitShed(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate budget exhausted, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucketGovernor:
+    """Process-wide token bucket shared by every caller of one upstream.
+
+    A 429 empties the bucket, blocks all callers until Retry-After has passed and halves the
+    refill rate; successes then grow it back additively. Background callers never dip into the
+    interactive reserve and always yield to queued interactive callers. Callers beyond the queue
+    limit for their priority are shed with RateLimitShed instead of piling up.
+    """
+
+    def __init__(self, rate: float, burst: float, interactive_reserve: float, max_queue: dict[str, int]):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.reserve = interactive_reserve * burst
+        self.max_queue = max_queue
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.stats = {"granted": 0, "throttled": 0, "shed": 0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _eta(self, priority: str) -> float:
+        now = time.monotonic()
+        ahead = self.waiting[INTERACTIVE] + (self.waiting[BACKGROUND] if priority == BACKGROUND else 0)
+        return max(self.blocked_until - now, 0.0) + (ahead + 1) / self.rate
+
+    async def acquire(self, priority: str = INTERACTIVE):
+        if self.waiting[priority] >= self.max_queue[priority]:
+            self.stats["shed"] += 1
+            raise RateLimitShed(self._eta(priority))
+
+        floor = 1.0 if priority == INTERACTIVE else 1.0 + self.reserve
+        self.waiting[priority] += 1
+        try:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                yields = priority == BACKGROUND and self.waiting[INTERACTIVE] > 0
+                if now >= self.blocked_until and self.tokens >= floor and not yields:
+                    self.tokens -= 1
+                    self.stats["granted"] += 1
+                    return
+                wait = max(self.blocked_until - now, (floor - self.tokens) / self.rate, 0.05)
+                await asyncio.sleep(wait)
+        finally:
+            self.waiting[priority] -= 1
+
+    def on_throttled(self, retry_after: float):
+        now = time.monotonic()
+        self._refill(now)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.tokens = 0.0
+        self.rate = max(self.base_rate / 10, self.rate / 2)
+        self.stats["throttled"] += 1
+
+    def cap(self, rate: float):
+        """Lower the refill rate to at most `rate`, e.g. for a separate process sharing the upstream's quota."""
+        self.base_rate = min(self.base_rate, rate)
+        self.rate = min(self.rate, self.base_rate)
+
+    def on_success(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate / 20)
+
+    def snapshot(self) -> dict:
+        self._refill(time.monotonic())
+        return {
+            "rate": round(self.rate, 2),
+            "base_rate": self.base_rate,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": round(max(self.blocked_until - time.monotonic(), 0.0), 2),
+            "waiting": dict(self.waiting),
+            **self.stats,
+        }
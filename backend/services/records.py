@@ -0,0 +1,119 @@
+import sys
+from dataclasses import dataclass, field
+
+TRACK_SOURCES = ("top_short", "top_medium", "top_long", "recently_played", "saved_tracks")
+ARTIST_SOURCES = ("top_artists_short", "top_artists_medium")
+
+
+@dataclass(slots=True)
+class ArtistRecord:
+    id: str
+    name: str
+    genre_ids: tuple[int, ...] = ()
+    popularity: int = 0
+    resolved: bool = False
+
+
+@dataclass(slots=True)
+class TrackRecord:
+    name: str | None
+    album: str | None
+    release_date: str
+    popularity: int
+    duration_ms: int
+    explicit: bool
+    artists: tuple[int, ...]
+
+
+@dataclass(slots=True)
+class Library:
+    """One user's fetched tracks and artists in compact form.
+
+    Genres are interned once per library and referenced by ID, and each artist is stored once;
+    tracks point at artists by index, so a genre list is never copied per track. Spotify payloads
+    are reduced to the fields the analyzer reads as soon as they are ingested. Profile builds read
+    it directly through TasteState.from_library; to_data() expands it into the dict shape that
+    build_taste_profile and the batch analyzer take.
+    """
+
+    genres: list[str] = field(default_factory=list)
+    artists: list[ArtistRecord] = field(default_factory=list)
+    tracks: dict[str, list[TrackRecord]] = field(default_factory=dict)
+    top_artists: dict[str, list[int]] = field(default_factory=dict)
+    _genre_index: dict[str, int] = field(default_factory=dict)
+    _artist_index: dict[str, int] = field(default_factory=dict)
+
+    def intern_genres(self, genres) -> tuple[int, ...]:
+        ids = []
+        for genre in genres or ():
+            gid = self._genre_index.get(genre)
+            if gid is None:
+                gid = self._genre_index[genre] = len(self.genres)
+                self.genres.append(sys.intern(genre))
+            ids.append(gid)
+        return tuple(ids)
+
+    def _artist(self, artist_id: str, name: str) -> int:
+        index = self._artist_index.get(artist_id)
+        if index is None:
+            index = self._artist_index[artist_id] = len(self.artists)
+            self.artists.append(ArtistRecord(id=artist_id, name=sys.intern(name or "")))
+        return index
+
+    def track_record(self, track: dict) -> TrackRecord:
+        """Compact record for a raw Spotify track object (same fields as extract_track_meta)."""
+        album = track.get("album") or {}
+        return TrackRecord(
+            name=track.get("name"),
+            album=album.get("name"),
+            release_date=album.get("release_date", ""),
+            popularity=track.get("popularity", 0),
+            duration_ms=track.get("duration_ms", 0),
+            explicit=track.get("explicit", False),
+            artists=tuple(self._artist(a["id"], a.get("name", "")) for a in track.get("artists", [])),
+        )
+
+    def update_artist(self, artist: dict) -> int:
+        """Record genres and popularity from a full Spotify artist payload; returns its index."""
+        index = self._artist(artist["id"], artist.get("name", ""))
+        record = self.artists[index]
+        record.genre_ids = self.intern_genres(artist.get("genres"))
+        record.popularity = artist.get("popularity", 0) or 0
+        record.resolved = True
+        return index
+
+    def artist_ids(self) -> list[str]:
+        return list(self._artist_index)
+
+    def artist_genres(self, record: ArtistRecord) -> list[str]:
+        return [self.genres[g] for g in record.genre_ids]
+
+    def track_genres(self, record: TrackRecord) -> list[str]:
+        genres = []
+        for index in record.artists:
+            genres.extend(self.genres[g] for g in self.artists[index].genre_ids)
+        return genres
+
+    def track_dict(self, record: TrackRecord) -> dict:
+        """The enriched extract_track_meta dict for one record."""
+        artists = [self.artists[i] for i in record.artists]
+        return {
+            "name": record.name,
+            "artists": [a.name for a in artists],
+            "artist_ids": [a.id for a in artists],
+            "album": record.album,
+            "release_date": record.release_date,
+            "popularity": record.popularity,
+            "duration_ms": record.duration_ms,
+            "explicit": record.explicit,
+            "genres": self.track_genres(record),
+        }
+
+    def to_data(self) -> dict:
+        data = {source: [self.track_dict(t) for t in self.tracks.get(source, [])] for source in TRACK_SOURCES}
+        for source in ARTIST_SOURCES:
+            data[source] = [
+                {"name": a.name, "genres": self.artist_genres(a), "popularity": a.popularity}
+                for a in (self.artists[i] for i in self.top_artists.get(source, []))
+            ]
+        return data
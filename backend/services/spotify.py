@@ -1,9 +1,16 @@
+import asyncio
 import os
+import time
 from datetime import datetime, timezone
 from urllib.parse import urlencode
 
 import httpx
 
+from services.artist_cache import get_cached_artists, store_artists
+from services.http_clients import get_client
+from services.rate_limit import BACKGROUND, INTERACTIVE, TokenBucketGovernor
+from services.records import ARTIST_SOURCES, TRACK_SOURCES, Library
+
 SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
 SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
 SPOTIFY_API_BASE = "https://api.spotify.com/v1"
@@ -18,6 +25,23 @@ SCOPES = [
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://127.0.0.1:3000/callback")
+MAX_CONCURRENCY = int(os.getenv("SPOTIFY_MAX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+MAX_PAGES = int(os.getenv("SPOTIFY_MAX_PAGES", "40"))
+PAGE_BUFFER_TRACKS = int(os.getenv("SPOTIFY_PAGE_BUFFER_TRACKS", "500"))
+PAGE_SIZE = 50
+FULL_LIBRARY = os.getenv("SPOTIFY_FULL_LIBRARY", "false").lower() in ("1", "true", "yes")
+MAX_RETRY_AFTER = float(os.getenv("SPOTIFY_MAX_RETRY_AFTER", "30"))
+
+governor = TokenBucketGovernor(
+    rate=float(os.getenv("SPOTIFY_RATE_PER_SEC", "10")),
+    burst=float(os.getenv("SPOTIFY_BURST", "20")),
+    interactive_reserve=float(os.getenv("SPOTIFY_INTERACTIVE_RESERVE", "0.5")),
+    max_queue={
+        INTERACTIVE: int(os.getenv("SPOTIFY_MAX_QUEUE_INTERACTIVE", "200")),
+        BACKGROUND: int(os.getenv("SPOTIFY_MAX_QUEUE_BACKGROUND", "50")),
+    },
+)
 
 
 def get_auth_url(state: str) -> str:
@@ -32,58 +56,88 @@ def get_auth_url(state: str) -> str:
 
 
 async def exchange_code(code: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            SPOTIFY_TOKEN_URL,
-            data={
-                "grant_type": "authorization_code",
-                "code": code,
-                "redirect_uri": REDIRECT_URI,
-                "client_id": CLIENT_ID,
-                "client_secret": CLIENT_SECRET,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        resp.raise_for_status()
-        return resp.json()
+    resp = await get_client("spotify_accounts").post(
+        SPOTIFY_TOKEN_URL,
+        data={
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": REDIRECT_URI,
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    resp.raise_for_status()
+    return resp.json()
 
 
 async def refresh_access_token(refresh_token: str) -> dict:
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(
-            SPOTIFY_TOKEN_URL,
-            data={
-                "grant_type": "refresh_token",
-                "refresh_token": refresh_token,
-                "client_id": CLIENT_ID,
-                "client_secret": CLIENT_SECRET,
-            },
-            headers={"Content-Type": "application/x-www-form-urlencoded"},
-        )
-        resp.raise_for_status()
-        return resp.json()
+    resp = await get_client("spotify_accounts").post(
+        SPOTIFY_TOKEN_URL,
+        data={
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+            "client_id": CLIENT_ID,
+            "client_secret": CLIENT_SECRET,
+        },
+        headers={"Content-Type": "application/x-www-form-urlencoded"},
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _retry_after(resp: httpx.Response) -> float:
+    try:
+        return min(float(resp.headers.get("Retry-After", "2")), MAX_RETRY_AFTER)
+    except ValueError:
+        return 2.0
+
+
+def _describe(error: httpx.HTTPError) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return str(error.response.status_code)
+    return f"{type(error).__name__}: {error}"
+
+
+async def _gather_or_cancel(coros) -> list:
+    """asyncio.gather that cancels and awaits the remaining coroutines when one of them raises."""
+    tasks = [asyncio.ensure_future(c) for c in coros]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
 
 
 class SpotifyClient:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, max_concurrency: int = MAX_CONCURRENCY, priority: str = INTERACTIVE):
         self.access_token = access_token
+        self.priority = priority
         self.headers = {"Authorization": f"Bearer {access_token}"}
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.timings: dict[str, float] = {}
+        self.errors: dict[str, Exception] = {}
 
     async def _get(self, endpoint: str, params: dict | None = None) -> dict:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{SPOTIFY_API_BASE}{endpoint}",
-                headers=self.headers,
-                params=params or {},
-                timeout=15.0,
-            )
-            if resp.status_code == 429:
-                import asyncio
-                retry_after = int(resp.headers.get("Retry-After", "2"))
-                await asyncio.sleep(retry_after)
-                return await self._get(endpoint, params)
-            resp.raise_for_status()
-            return resp.json()
+        for attempt in range(MAX_RETRIES + 1):
+            async with self._semaphore:
+                await governor.acquire(self.priority)
+                resp = await get_client("spotify").get(
+                    f"{SPOTIFY_API_BASE}{endpoint}",
+                    headers=self.headers,
+                    params=params or {},
+                    timeout=15.0,
+                )
+            if resp.status_code != 429:
+                governor.on_success()
+                resp.raise_for_status()
+                return resp.json()
+            retry_after = _retry_after(resp)
+            governor.on_throttled(retry_after)
+            print(f"[spotify] 429 on {endpoint}, retry {attempt + 1}/{MAX_RETRIES} after {retry_after:.0f}s", flush=True)
+        resp.raise_for_status()
 
     async def get_current_user(self) -> dict:
         return await self._get("/me")
@@ -103,6 +157,13 @@ class SpotifyClient:
         except httpx.HTTPStatusError:
             return []
 
+    async def get_recently_played_after(self, after_ms: int | None = None, limit: int = 50) -> dict:
+        """Raw recently-played page (items with played_at, plus cursors) for plays after `after_ms`."""
+        params = {"limit": limit}
+        if after_ms is not None:
+            params["after"] = after_ms
+        return await self._get("/me/player/recently-played", params)
+
     async def get_saved_tracks(self, limit: int = 50) -> list[dict]:
         try:
             data = await self._get("/me/tracks", {"limit": limit})
@@ -110,15 +171,81 @@ class SpotifyClient:
         except httpx.HTTPStatusError:
             return []
 
+    async def _iter_pages(self, endpoint: str, params: dict, unwrap, convert, max_pages: int, buffer_tracks: int):
+        """Yield converted pages of a paged endpoint as they arrive.
+
+        The first page gives the total; the remaining offsets are then fetched concurrently, with
+        at most buffer_tracks // PAGE_SIZE raw pages in flight or awaiting conversion at once.
+        Pages that fail are skipped.
+        """
+        first = await self._get(endpoint, {**params, "limit": PAGE_SIZE, "offset": 0})
+        total = first.get("total") or 0
+        yield [convert(t) for t in unwrap(first)]
+        del first
+
+        offsets = iter(range(PAGE_SIZE, min(total, max_pages * PAGE_SIZE), PAGE_SIZE))
+        window = max(1, buffer_tracks // PAGE_SIZE)
+        pending: set[asyncio.Task] = set()
+
+        def launch():
+            while len(pending) < window:
+                offset = next(offsets, None)
+                if offset is None:
+                    return
+                pending.add(asyncio.create_task(self._get(endpoint, {**params, "limit": PAGE_SIZE, "offset": offset})))
+
+        launch()
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+                for task in done:
+                    try:
+                        metas = [convert(t) for t in unwrap(task.result())]
+                    except httpx.HTTPError as e:
+                        print(f"[spotify] page of {endpoint} failed with {_describe(e)}, skipping", flush=True)
+                        continue
+                    launch()
+                    yield metas
+                launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def iter_saved_tracks(self, convert=None, max_pages: int = MAX_PAGES, buffer_tracks: int = PAGE_BUFFER_TRACKS):
+        """Async generator over the whole liked-songs library, one page of converted tracks at a time.
+
+        `convert` maps each raw track object and defaults to extract_track_meta.
+        """
+        unwrap = lambda page: [item["track"] for item in page.get("items", []) if item.get("track")]
+        return self._iter_pages("/me/tracks", {}, unwrap, convert or self.extract_track_meta, max_pages, buffer_tracks)
+
+    def iter_top_tracks(self, time_range: str = "medium_term", convert=None, max_pages: int = MAX_PAGES, buffer_tracks: int = PAGE_BUFFER_TRACKS):
+        """Async generator over every top track Spotify exposes for a time range, like iter_saved_tracks."""
+        unwrap = lambda page: page.get("items", [])
+        return self._iter_pages("/me/top/tracks", {"time_range": time_range}, unwrap, convert or self.extract_track_meta, max_pages, buffer_tracks)
+
+    async def _collect(self, pages) -> list:
+        items = []
+        async for page in pages:
+            items.extend(page)
+        return items
+
+    async def _converted(self, tracks, convert) -> list:
+        return [convert(t) for t in await tracks]
+
     async def get_artist_details(self, artist_ids: list[str]) -> list[dict]:
-        results = []
-        for i in range(0, len(artist_ids), 50):
-            batch = artist_ids[i : i + 50]
+        async def fetch_batch(batch: list[str]) -> list[dict]:
             try:
                 data = await self._get("/artists", {"ids": ",".join(batch)})
-                results.extend(a for a in data.get("artists", []) if a)
-            except httpx.HTTPStatusError:
-                continue
+                return [a for a in data.get("artists", []) if a]
+            except httpx.HTTPError:
+                return []
+
+        batches = [artist_ids[i : i + 50] for i in range(0, len(artist_ids), 50)]
+        results = []
+        for batch_result in await _gather_or_cancel(fetch_batch(b) for b in batches):
+            results.extend(batch_result)
         return results
 
     def extract_track_meta(self, track: dict) -> dict:
@@ -136,87 +263,123 @@ class SpotifyClient:
             "explicit": track.get("explicit", False),
         }
 
-    async def fetch_all_data(self) -> dict:
-        top_short = await self.get_top_tracks("short_term")
-        top_medium = await self.get_top_tracks("medium_term")
-        top_long = await self.get_top_tracks("long_term")
-        top_artists_short = await self.get_top_artists("short_term")
-        top_artists_medium = await self.get_top_artists("medium_term")
-        recently_played = await self.get_recently_played()
-        saved_tracks = await self.get_saved_tracks()
-
-        all_artist_ids: set[str] = set()
-        for track_list in [top_short, top_medium, top_long, recently_played, saved_tracks]:
-            for track in track_list:
-                for artist in track.get("artists", []):
-                    all_artist_ids.add(artist["id"])
-        for artist in top_artists_short + top_artists_medium:
-            all_artist_ids.add(artist["id"])
+    async def _timed(self, source: str, coro) -> list[dict]:
+        """Await one source, recording its wall time.
+
+        HTTP errors, including timeouts and connection failures, degrade it to an empty list.
+        Anything else, such as RateLimitShed, propagates.
+        """
+        start = time.perf_counter()
+        try:
+            return await coro
+        except httpx.HTTPError as e:
+            print(f"[spotify] {source} failed with {_describe(e)}, continuing without it", flush=True)
+            self.errors[source] = e
+            return []
+        finally:
+            self.timings[source] = time.perf_counter() - start
+
+    async def fetch_all_data(self, concurrent: bool = True, recently_played_source=None, full_library: bool = FULL_LIBRARY) -> dict:
+        """Fetch and enrich everything the analyzer needs, as the analyzer's input dict.
+
+        See fetch_library for the arguments. Profile builds call fetch_library and read the records
+        with TasteState.from_library instead, since expanding every track into a dict costs more
+        memory than the records themselves.
+        """
+        library = await self.fetch_library(concurrent, recently_played_source, full_library)
+        return library.to_data()
+
+    async def fetch_library(self, concurrent: bool = True, recently_played_source=None, full_library: bool = FULL_LIBRARY) -> Library:
+        """Fetch and enrich everything the analyzer needs into a compact Library.
+
+        `recently_played_source` is an optional async callable that replaces the live
+        recently-played endpoint, e.g. to read the user's stored listening history instead.
+        `full_library` pages through all saved and top tracks (up to SPOTIFY_MAX_PAGES each) instead
+        of the first 50; it defaults to SPOTIFY_FULL_LIBRARY.
+        """
+        self.timings = {}
+        self.errors = {}
+        started = time.perf_counter()
+        library = Library()
+        record = library.track_record
+
+        recently_played_source = recently_played_source or self.get_recently_played
+
+        def top(time_range: str):
+            if full_library:
+                return lambda: self._collect(self.iter_top_tracks(time_range, convert=record))
+            return lambda: self._converted(self.get_top_tracks(time_range), record)
+
+        sources = {
+            "top_short": top("short_term"),
+            "top_medium": top("medium_term"),
+            "top_long": top("long_term"),
+            "top_artists_short": lambda: self.get_top_artists("short_term"),
+            "top_artists_medium": lambda: self.get_top_artists("medium_term"),
+            "recently_played": lambda: self._converted(recently_played_source(), record),
+            "saved_tracks": (
+                (lambda: self._collect(self.iter_saved_tracks(convert=record)))
+                if full_library
+                else (lambda: self._converted(self.get_saved_tracks(), record))
+            ),
+        }
+        if concurrent:
+            results = await _gather_or_cancel(self._timed(name, fn()) for name, fn in sources.items())
+        else:
+            results = [await self._timed(name, fn()) for name, fn in sources.items()]
+        if len(self.errors) == len(sources):
+            raise next(iter(self.errors.values()))
+        fetched = dict(zip(sources, results))
+
+        for source in TRACK_SOURCES:
+            library.tracks[source] = fetched[source]
+        top_artists_short = fetched["top_artists_short"]
+        top_artists_medium = fetched["top_artists_medium"]
+        for source in ARTIST_SOURCES:
+            library.top_artists[source] = [library.update_artist(a) for a in fetched[source] if a.get("id")]
 
         print(f"[spotify] top_artists_short count: {len(top_artists_short)}", flush=True)
         for a in top_artists_short[:5]:
             print(f"[spotify]   artist={a.get('name')}, genres={a.get('genres')}, popularity={a.get('popularity')}", flush=True)
 
-        artist_details = await self.get_artist_details(list(all_artist_ids))
-        artist_map = {a["id"]: a for a in artist_details if a}
-        print(f"[spotify] artist_details returned: {len(artist_details)} of {len(all_artist_ids)} requested", flush=True)
-
-        artists_with_genres = sum(1 for a in artist_details if a and a.get("genres"))
-        print(f"[spotify] artists with genres from Spotify: {artists_with_genres}/{len(artist_details)}", flush=True)
-
-        def enrich(tracks: list[dict]) -> list[dict]:
-            enriched = []
-            for t in tracks:
-                meta = self.extract_track_meta(t)
-                genres = []
-                for aid in meta["artist_ids"]:
-                    if aid in artist_map:
-                        genres.extend(artist_map[aid].get("genres", []))
-                meta["genres"] = genres
-                enriched.append(meta)
-            return enriched
-
-        all_spotify_genres: set[str] = set()
-        for a in artist_details:
+        # Top-artist payloads already carry full details, so only the remaining IDs go to the cache.
+        known = {a["id"]: a for a in top_artists_short + top_artists_medium if a.get("id")}
+        cached, missing = get_cached_artists([aid for aid in library.artist_ids() if aid not in known])
+        fetched_artists = await self._timed("artists", self.get_artist_details(missing))
+        store_artists(list(known.values()) + fetched_artists)
+        for a in list(cached.values()) + fetched_artists:
             if a:
-                all_spotify_genres.update(a.get("genres") or [])
-        for a in top_artists_short + top_artists_medium:
-            all_spotify_genres.update(a.get("genres") or [])
-        print(f"[spotify] total unique genres from Spotify: {len(all_spotify_genres)}", flush=True)
+                library.update_artist(a)
+        resolved = sum(1 for a in library.artists if a.resolved)
+        print(
+            f"[spotify] artist details: {len(known)} from top artists, {len(cached)} cached, "
+            f"{len(fetched_artists)}/{len(missing)} fetched, {resolved} of {len(library.artists)} resolved",
+            flush=True,
+        )
+        del fetched, top_artists_short, top_artists_medium, known, cached, fetched_artists
 
-        if not all_spotify_genres:
+        artists_with_genres = sum(1 for a in library.artists if a.resolved and a.genre_ids)
+        print(f"[spotify] artists with genres from Spotify: {artists_with_genres}/{resolved}", flush=True)
+        print(f"[spotify] total unique genres from Spotify: {len(library.genres)}", flush=True)
+
+        if not library.genres:
             print("[spotify] WARNING: Spotify returned zero genres, will need MusicBrainz fallback", flush=True)
-            from services.genre_lookup import lookup_genres_batch
-            artist_names = list({a.get("name", "") for a in top_artists_short + top_artists_medium if a.get("name")})
-            mb_genres = await lookup_genres_batch(artist_names[:15])
+            from services.genre_lookup import MUSICBRAINZ_DEADLINE, lookup_genres_batch
+            top_indices = library.top_artists["top_artists_short"] + library.top_artists["top_artists_medium"]
+            artist_names = list({library.artists[i].name for i in top_indices if library.artists[i].name})
+            mb_genres = await lookup_genres_batch(artist_names[:15], deadline=MUSICBRAINZ_DEADLINE)
             print(f"[spotify] MusicBrainz returned genres for {sum(1 for v in mb_genres.values() if v)}/{len(artist_names[:15])} artists", flush=True)
 
-            for a in artist_details:
-                if a and not a.get("genres"):
-                    mb = mb_genres.get(a.get("name", ""), [])
-                    if mb:
-                        a["genres"] = mb
-            artist_map = {a["id"]: a for a in artist_details if a}
-
-            for artist_list_key in [top_artists_short, top_artists_medium]:
-                for a in artist_list_key:
-                    if not a.get("genres"):
-                        mb = mb_genres.get(a.get("name", ""), [])
-                        if mb:
-                            a["genres"] = mb
+            for a in library.artists:
+                if a.resolved and not a.genre_ids and mb_genres.get(a.name):
+                    a.genre_ids = library.intern_genres(mb_genres[a.name])
 
-        return {
-            "top_short": enrich(top_short),
-            "top_medium": enrich(top_medium),
-            "top_long": enrich(top_long),
-            "recently_played": enrich(recently_played),
-            "saved_tracks": enrich(saved_tracks),
-            "top_artists_short": [
-                {"name": a["name"], "genres": a.get("genres") or [], "popularity": a.get("popularity", 0)}
-                for a in top_artists_short
-            ],
-            "top_artists_medium": [
-                {"name": a["name"], "genres": a.get("genres") or [], "popularity": a.get("popularity", 0)}
-                for a in top_artists_medium
-            ],
-        }
+        self.timings["total"] = time.perf_counter() - started
+        serial = sum(t for name, t in self.timings.items() if name != "total")
+        print(
+            f"[spotify] fetch_all_data mode={'concurrent' if concurrent else 'sequential'} "
+            f"wall={self.timings['total']:.2f}s sum_of_sources={serial:.2f}s "
+            + " ".join(f"{name}={t:.2f}s" for name, t in self.timings.items() if name != "total"),
+            flush=True,
+        )
+        return library
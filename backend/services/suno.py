@@ -1,12 +1,18 @@
 import asyncio
 import os
+import time
+from collections import deque
+from statistics import median
 
 import httpx
 
+from services.http_clients import get_client
+
 SUNO_API_URL = os.getenv("SUNO_API_URL", "http://suno-api:3000")
-POLL_INTERVAL_INITIAL = 5
-POLL_INTERVAL_LATE = 10
-LATE_THRESHOLD = 60
+POLL_MIN_INTERVAL = float(os.getenv("SUNO_POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL = float(os.getenv("SUNO_POLL_MAX_INTERVAL", "10"))
+# Initial guess for how long a clip takes, until real completions have been observed.
+POLL_EXPECTED_DURATION = float(os.getenv("SUNO_POLL_EXPECTED_SECONDS", "60"))
 TIMEOUT = 180
 
 
@@ -15,92 +21,200 @@ class SunoError(Exception):
 
 
 async def submit_generation(prompt: str, tags: str, title: str = "My Reso Track") -> str:
-    async with httpx.AsyncClient(timeout=300.0) as client:
-        resp = await client.post(
-            f"{SUNO_API_URL}/api/custom_generate",
-            json={
-                "prompt": prompt,
-                "title": title,
-                "tags": tags,
-                "make_instrumental": False,
-                "model": "chirp-v4",
-            },
-        )
-        if resp.status_code == 401:
-            raise SunoError("Suno session expired. Please update SUNO_COOKIE in .env and restart Docker.")
-        resp.raise_for_status()
-        data = resp.json()
-        if isinstance(data, list) and len(data) > 0:
-            return data[0]["id"]
-        raise SunoError("Unexpected response from Suno API")
+    resp = await get_client("suno").post(
+        f"{SUNO_API_URL}/api/custom_generate",
+        json={
+            "prompt": prompt,
+            "title": title,
+            "tags": tags,
+            "make_instrumental": False,
+            "model": "chirp-v4",
+        },
+        timeout=300.0,
+    )
+    if resp.status_code == 401:
+        raise SunoError("Suno session expired. Please update SUNO_COOKIE in .env and restart Docker.")
+    resp.raise_for_status()
+    data = resp.json()
+    if isinstance(data, list) and len(data) > 0:
+        return data[0]["id"]
+    raise SunoError("Unexpected response from Suno API")
 
 
 async def check_captcha_pending() -> dict | None:
-    async with httpx.AsyncClient(timeout=5.0) as client:
-        resp = await client.get(f"{SUNO_API_URL}/api/captcha/pending")
-        resp.raise_for_status()
-        data = resp.json()
-        if data.get("pending"):
-            return {"image": data["image"], "prompt": data["prompt"]}
-        return None
+    resp = await get_client("suno").get(f"{SUNO_API_URL}/api/captcha/pending", timeout=5.0)
+    resp.raise_for_status()
+    data = resp.json()
+    if data.get("pending"):
+        return {"image": data["image"], "prompt": data["prompt"]}
+    return None
 
 
 async def submit_captcha_solution(coordinates: list[dict]) -> bool:
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        resp = await client.post(
-            f"{SUNO_API_URL}/api/captcha/solve",
-            json={"coordinates": coordinates},
-        )
-        resp.raise_for_status()
-        return resp.json().get("ok", False)
+    resp = await get_client("suno").post(
+        f"{SUNO_API_URL}/api/captcha/solve",
+        json={"coordinates": coordinates},
+        timeout=10.0,
+    )
+    resp.raise_for_status()
+    return resp.json().get("ok", False)
+
+
+def _complete(track: dict) -> dict:
+    return {
+        "audio_url": track.get("audio_url", ""),
+        "image_url": track.get("image_url", ""),
+        "title": track.get("title", ""),
+    }
+
+
+class SunoPoller:
+    """One background loop that polls every pending clip in a single GET /api/get?ids=... per tick.
+
+    Waiters get a future that resolves as soon as a tick sees their clip complete. The interval
+    adapts to the median completion time observed so far: ticks are sparse while every clip is
+    young, and tighten to min_interval as clips approach the expected completion time. The loop
+    runs only while something is waiting.
+    """
+
+    def __init__(self, min_interval: float, max_interval: float, expected: float, timeout: float, max_errors: int = 5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_expected = expected
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self._waiters: dict[str, tuple[asyncio.Future, float]] = {}
+        self._durations: deque[float] = deque(maxlen=20)
+        self._task: asyncio.Task | None = None
+        self.stats = {"ticks": 0, "completed": 0, "failed": 0, "timed_out": 0, "errors": 0}
+
+    def expected_duration(self) -> float:
+        return median(self._durations) if self._durations else self.default_expected
+
+    def _next_interval(self) -> float:
+        now = time.monotonic()
+        expected = self.expected_duration()
+        # Half the time left until the youngest-but-nearest clip is expected to finish.
+        soonest = min(expected - (now - started) for _, started in self._waiters.values())
+        return min(max(soonest / 2, self.min_interval), self.max_interval)
+
+    async def wait(self, clip_id: str) -> dict:
+        entry = self._waiters.get(clip_id)
+        if entry is None:
+            entry = self._waiters[clip_id] = (asyncio.get_running_loop().create_future(), time.monotonic())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            self._task.add_done_callback(self._run_done)
+        return await asyncio.shield(entry[0])
+
+    def _run_done(self, task: asyncio.Task):
+        # Ticks catch their own errors, so this is a bug in the loop itself; don't leave waiters hanging.
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[poll] poller crashed: {task.exception()!r}", flush=True)
+            self._fail_all(SunoError(f"Suno poller failed: {task.exception()}"))
+
+    def _resolve(self, clip_id: str, result: dict | None = None, error: Exception | None = None):
+        future, started = self._waiters.pop(clip_id)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            self._durations.append(time.monotonic() - started)
+            future.set_result(result)
+
+    def _fail_all(self, error: Exception):
+        for clip_id in list(self._waiters):
+            self._resolve(clip_id, error=error)
+
+    async def _tick(self, client: httpx.AsyncClient, ids: list[str]) -> tuple[str, str] | None:
+        """Poll `ids` once and resolve finished clips; returns (log message, failure) for a retryable error."""
+        try:
+            resp = await client.get(f"{SUNO_API_URL}/api/get", params={"ids": ",".join(ids)})
+        except httpx.RequestError as e:
+            return f"request error: {e}", "Suno API unreachable"
+        if resp.status_code >= 500:
+            return f"Suno API returned {resp.status_code}", f"Suno API returned {resp.status_code}"
+        if resp.status_code == 401:
+            self._fail_all(SunoError("Suno session expired. Please update SUNO_COOKIE in .env and restart Docker."))
+            return None
+        try:
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            self._fail_all(e)
+            return None
 
+        data = resp.json()
+        if not isinstance(data, list):
+            print(f"[poll] unexpected response shape: {str(data)[:300]}", flush=True)
+            return None
+        statuses = {}
+        for track in data:
+            clip_id, status = track.get("id"), track.get("status", "")
+            if clip_id not in self._waiters:
+                continue
+            statuses[clip_id] = status
+            if status == "complete":
+                self.stats["completed"] += 1
+                self._resolve(clip_id, _complete(track))
+            elif status in ("error", "failed"):
+                self.stats["failed"] += 1
+                self._resolve(clip_id, error=SunoError(f"Suno generation failed with status: {status}"))
+        print(f"[poll] {len(ids)} clips, statuses={statuses}", flush=True)
+        return None
 
-async def poll_for_completion(track_id: str) -> dict:
-    elapsed = 0
-    consecutive_errors = 0
-    max_consecutive_errors = 5
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        while elapsed < TIMEOUT:
-            interval = POLL_INTERVAL_INITIAL if elapsed < LATE_THRESHOLD else POLL_INTERVAL_LATE
-            await asyncio.sleep(interval)
-            elapsed += interval
-
-            print(f"[poll] checking status for {track_id} (elapsed={elapsed}s)", flush=True)
+    async def _run(self):
+        client = get_client("suno")
+        consecutive_errors = 0
+        while self._waiters:
+            await asyncio.sleep(self._next_interval())
+            now = time.monotonic()
+            for clip_id, (_, started) in list(self._waiters.items()):
+                if now - started > self.timeout:
+                    self.stats["timed_out"] += 1
+                    self._resolve(clip_id, error=SunoError("Suno generation timed out after 3 minutes"))
+            ids = list(self._waiters)
+            if not ids:
+                break
+
+            self.stats["ticks"] += 1
             try:
-                resp = await client.get(f"{SUNO_API_URL}/api/get", params={"ids": track_id})
-            except httpx.RequestError as e:
-                consecutive_errors += 1
-                print(f"[poll] request error ({consecutive_errors}/{max_consecutive_errors}): {e}", flush=True)
-                if consecutive_errors >= max_consecutive_errors:
-                    raise SunoError(f"Suno API unreachable after {max_consecutive_errors} retries")
+                error = await self._tick(client, ids)
+            except Exception as e:
+                # e.g. a non-JSON body from a proxy in front of suno-api; retried like a 5xx.
+                error = f"unexpected error: {e!r}", "Suno API returned an invalid response"
+            if error is None:
+                consecutive_errors = 0
                 continue
+            problem, failure = error
+            consecutive_errors += 1
+            self.stats["errors"] += 1
+            print(f"[poll] {problem} ({consecutive_errors}/{self.max_errors}), retrying...", flush=True)
+            if consecutive_errors >= self.max_errors:
+                self._fail_all(SunoError(f"{failure} after {self.max_errors} retries"))
+                consecutive_errors = 0
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._fail_all(SunoError("Server shutting down"))
 
-            if resp.status_code == 401:
-                raise SunoError("Suno session expired. Please update SUNO_COOKIE in .env and restart Docker.")
-            if resp.status_code >= 500:
-                consecutive_errors += 1
-                print(f"[poll] suno-api returned {resp.status_code} ({consecutive_errors}/{max_consecutive_errors}), retrying...", flush=True)
-                if consecutive_errors >= max_consecutive_errors:
-                    raise SunoError(f"Suno API returned {resp.status_code} after {max_consecutive_errors} retries")
-                continue
-            resp.raise_for_status()
-            consecutive_errors = 0
-
-            data = resp.json()
-            if isinstance(data, list) and len(data) > 0:
-                track = data[0]
-                status = track.get("status", "")
-                audio_url = track.get("audio_url", "")
-                print(f"[poll] status={status}, audio_url={'yes' if audio_url else 'none'}", flush=True)
-                if status == "complete":
-                    return {
-                        "audio_url": audio_url,
-                        "image_url": track.get("image_url", ""),
-                        "title": track.get("title", ""),
-                    }
-                if status in ("error", "failed"):
-                    raise SunoError(f"Suno generation failed with status: {status}")
-            else:
-                print(f"[poll] unexpected response shape: {str(data)[:300]}", flush=True)
-
-    raise SunoError("Suno generation timed out after 3 minutes")
+    def snapshot(self) -> dict:
+        return {
+            "pending": len(self._waiters),
+            "expected_duration": round(self.expected_duration(), 1),
+            **self.stats,
+        }
+
+
+poller = SunoPoller(POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_EXPECTED_DURATION, TIMEOUT)
+
+
+async def poll_for_completion(track_id: str) -> dict:
+    """Wait for a clip to complete through the shared poller."""
+    return await poller.wait(track_id)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, select
+
+from db import User, engine
+from services.spotify import refresh_access_token
+
+TOKEN_REFRESH_MARGIN = timedelta(seconds=int(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "300")))
+TOKEN_REFRESH_INTERVAL = float(os.getenv("TOKEN_REFRESH_INTERVAL_SECONDS", "60"))
+TOKEN_REFRESH_ACTIVE_WINDOW = float(os.getenv("TOKEN_REFRESH_ACTIVE_MINUTES", "120")) * 60
+
+_DB_CHUNK = 500
+
+
+class TokenRefresher:
+    """Keeps Spotify access tokens of recently active users fresh in the background.
+
+    Every interval, users seen within the active window whose token expires before the next
+    tick (plus a safety margin) are refreshed and the new token and expiry are written back.
+    Concurrent refreshes for one user share a single call to accounts.spotify.com, so request
+    handlers only wait on it when a token has already expired, e.g. the first request after an
+    idle period.
+    """
+
+    def __init__(self, margin: timedelta, interval: float, active_window: float):
+        self.margin = margin
+        self.interval = interval
+        self.active_window = active_window
+        self._active: dict[str, float] = {}
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+        self.stats = {"refreshed": 0, "failed": 0, "merged": 0, "inline": 0, "background": 0}
+
+    def touch(self, user_id: str):
+        """Mark a user as active so the scheduler keeps their token fresh."""
+        self._active[user_id] = time.monotonic()
+
+    async def access_token(self, user_id: str) -> str:
+        """A valid access token for the user, refreshing inline only if it has already expired."""
+        self.touch(user_id)
+        with Session(engine) as session:
+            user = session.get(User, user_id)
+            if user is None:
+                raise LookupError(f"user {user_id} not found")
+            token, expiry = user.access_token, user.token_expiry
+        now = datetime.utcnow()
+        if expiry > now:
+            if expiry <= now + self.margin and user_id not in self._inflight:
+                self.stats["background"] += 1
+                self._start(user_id)
+            return token
+        self.stats["inline"] += 1
+        return await self.refresh(user_id)
+
+    def _start(self, user_id: str) -> asyncio.Task:
+        task = asyncio.create_task(self._refresh(user_id))
+        self._inflight[user_id] = task
+        task.add_done_callback(lambda t: self._finish(user_id, t))
+        return task
+
+    def _finish(self, user_id: str, task: asyncio.Task):
+        if self._inflight.get(user_id) is task:
+            del self._inflight[user_id]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"[token_refresh] refresh for {user_id} failed: {task.exception()!r}", flush=True)
+
+    async def refresh(self, user_id: str) -> str:
+        """Refresh one user's token now, joining a refresh that is already running for them."""
+        task = self._inflight.get(user_id)
+        if task is not None:
+            self.stats["merged"] += 1
+        else:
+            task = self._start(user_id)
+        return await asyncio.shield(task)
+
+    async def _refresh(self, user_id: str) -> str:
+        with Session(engine) as session:
+            user = session.get(User, user_id)
+            if user is None:
+                raise LookupError(f"user {user_id} not found")
+            refresh_token = user.refresh_token
+        try:
+            token_data = await refresh_access_token(refresh_token)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        with Session(engine) as session:
+            user = session.get(User, user_id)
+            user.access_token = token_data["access_token"]
+            if "refresh_token" in token_data:
+                user.refresh_token = token_data["refresh_token"]
+            user.token_expiry = datetime.utcnow() + timedelta(seconds=token_data.get("expires_in", 3600))
+            session.add(user)
+            session.commit()
+            self.stats["refreshed"] += 1
+            return user.access_token
+
+    async def refresh_due(self) -> int:
+        """Refresh every active user whose token expires before the next tick; returns how many were due."""
+        cutoff = time.monotonic() - self.active_window
+        self._active = {uid: seen for uid, seen in self._active.items() if seen >= cutoff}
+        horizon = datetime.utcnow() + self.margin + timedelta(seconds=self.interval)
+        active = list(self._active)
+        due = []
+        with Session(engine) as session:
+            for i in range(0, len(active), _DB_CHUNK):
+                chunk = active[i : i + _DB_CHUNK]
+                due += session.exec(select(User.id).where(User.id.in_(chunk), User.token_expiry <= horizon)).all()
+        await asyncio.gather(*(self.refresh(uid) for uid in due), return_exceptions=True)
+        return len(due)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                due = await self.refresh_due()
+                if due:
+                    print(f"[token_refresh] refreshed {due} tokens ahead of expiry", flush=True)
+            except Exception as exc:
+                print(f"[token_refresh] scheduler tick failed: {exc!r}", flush=True)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._inflight.values()):
+            task.cancel()
+
+    def snapshot(self) -> dict:
+        return {"active_users": len(self._active), "in_flight": len(self._inflight), **self.stats}
+
+
+token_refresher = TokenRefresher(TOKEN_REFRESH_MARGIN, TOKEN_REFRESH_INTERVAL, TOKEN_REFRESH_ACTIVE_WINDOW)
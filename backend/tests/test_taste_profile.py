@@ -0,0 +1,93 @@
+import random
+
+import pytest
+
+from benchmarks.genre_matcher import vocabulary
+from benchmarks.taste_profile import synthetic_user
+from services.analyzer import TasteState, build_taste_profile
+from services.analyzer_batch import build_taste_profiles
+
+
+def track(genres=(), release_date="2015-06-01", popularity=50, explicit=False, name="Song", artists=("Artist",)):
+    return {
+        "name": name,
+        "artists": list(artists),
+        "release_date": release_date,
+        "popularity": popularity,
+        "explicit": explicit,
+        "genres": list(genres),
+    }
+
+
+def artist(name, genres=(), popularity=50):
+    return {"name": name, "genres": list(genres), "popularity": popularity}
+
+
+def assert_equivalent(data: dict):
+    expected = build_taste_profile(data)
+    assert TasteState.from_data(data).to_profile() == expected
+    assert build_taste_profiles([data]) == [expected]
+    return expected
+
+
+def test_tied_genres_keep_first_seen_order():
+    data = {
+        "top_short": [track(["shoegaze", "dream pop"]), track(["dream pop", "shoegaze"])],
+        "top_long": [track(["emo"]), track(["grunge"]), track(["emo", "grunge"])],
+    }
+    profile = assert_equivalent(data)
+    assert profile.top_genres[:2] == ["shoegaze", "dream pop"]
+    assert profile.top_genres[2:] == ["emo", "grunge"]
+
+
+def test_tied_artists_and_artist_genres():
+    data = {
+        "top_artists_short": [artist("A", ["techno"]), artist("B", ["house"]), artist("A", ["techno"])],
+        "top_artists_medium": [artist("B", ["house"]), artist("C", ["techno", "house"])],
+        "top_short": [track(["house"], artists=("A", "B"))],
+    }
+    profile = assert_equivalent(data)
+    assert profile.sample_top_artists == ["A", "B", "C"]
+
+
+@pytest.mark.parametrize("data", [
+    {},
+    {source: [] for source in ("top_short", "saved_tracks", "top_artists_short")},
+    {"top_artists_short": [artist("A", ["jazz"], 70)], "top_artists_medium": [artist("B", [], 0)]},
+], ids=["empty", "empty-sources", "artists-only"])
+def test_users_without_tracks(data):
+    profile = assert_equivalent(data)
+    assert profile.track_count == 0
+    assert profile.explicit_ratio == 0.0
+
+
+def test_tracks_without_release_year():
+    data = {
+        "saved_tracks": [track(release_date=d) for d in ("", "0000", "unknown", "1899-01-01", "2099")],
+        "recently_played": [track(release_date=None) for _ in range(2)],
+    }
+    profile = assert_equivalent(data)
+    assert (profile.era_range, profile.era_center) == ("2010s-2020s", 2018)
+
+
+def test_even_and_odd_year_counts():
+    for years in (["1990", "2000"], ["1990", "2000", "2011"], [str(y) for y in range(1970, 2020, 3)]):
+        assert_equivalent({"top_medium": [track(release_date=y) for y in years]})
+
+
+def test_non_integer_popularity():
+    data = {
+        "top_short": [track(popularity=p) for p in (55.5, 0.25, None, 0, -3, 100)],
+        "top_artists_medium": [artist("A", ["metal"], 33.3), artist("B", ["metal"], None)],
+    }
+    profile = assert_equivalent(data)
+    assert profile.popularity_avg == round((55.5 + 0.25 + 100 + 33.3) / 4, 1)
+
+
+def test_random_batch_matches_per_user_builds():
+    rng = random.Random(7)
+    genres = vocabulary()
+    batch = [synthetic_user(rng, genres, 40) for _ in range(60)]
+    expected = [build_taste_profile(data) for data in batch]
+    assert build_taste_profiles(batch) == expected
+    assert [TasteState.from_data(data).to_profile() for data in batch] == expected
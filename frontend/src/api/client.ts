@@ -30,7 +30,13 @@ export interface GenerationResult {
 }
 
 export interface SSEEvent {
-  type: "status" | "prompt_ready" | "complete" | "error" | "captcha_required";
+  type:
+    | "status"
+    | "suno_prompt_ready"
+    | "prompt_ready"
+    | "complete"
+    | "error"
+    | "captcha_required";
   data: Record<string, unknown>;
 }
 
@@ -54,6 +60,59 @@ export async function analyzeProfile(): Promise<TasteProfile> {
   return apiFetch("/api/profile/analyze");
 }
 
+const TERMINAL_EVENTS = ["complete", "error"];
+const RESUME_ATTEMPTS = 5;
+const RESUME_DELAY_MS = 2000;
+
+interface StreamState {
+  jobId: string | null;
+  lastEventId: string | null;
+  finished: boolean;
+}
+
+async function readEvents(
+  response: Response,
+  state: StreamState,
+  onEvent?: (event: SSEEvent) => void
+) {
+  const reader = response.body?.getReader();
+  if (!reader) return;
+
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let currentEvent = "";
+
+  while (true) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    const lines = buffer.split("\n");
+    buffer = lines.pop() || "";
+
+    for (const line of lines) {
+      if (line.startsWith("id: ")) {
+        state.lastEventId = line.slice(4).trim();
+      } else if (line.startsWith("event: ")) {
+        currentEvent = line.slice(7).trim();
+      } else if (line.startsWith("data: ") && currentEvent) {
+        try {
+          const data = JSON.parse(line.slice(6));
+          if (currentEvent === "job") {
+            state.jobId = data.job_id as string;
+          } else {
+            if (TERMINAL_EVENTS.includes(currentEvent)) state.finished = true;
+            onEvent?.({ type: currentEvent as SSEEvent["type"], data });
+          }
+        } catch {
+          // skip malformed data
+        }
+        currentEvent = "";
+      }
+    }
+  }
+}
+
 export function startGeneration(
   platform: string,
   customPrompt?: string,
@@ -61,52 +120,58 @@ export function startGeneration(
   onEvent?: (event: SSEEvent) => void
 ): AbortController {
   const controller = new AbortController();
+  const state: StreamState = { jobId: null, lastEventId: null, finished: false };
+
+  // The job keeps running on the server if the stream drops, so reconnect and resume after
+  // the last event we saw instead of starting (and paying for) a new generation.
+  const run = async () => {
+    try {
+      const response = await fetch(`${API_BASE}/api/generate`, {
+        method: "POST",
+        credentials: "include",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({
+          platform,
+          custom_prompt_override: customPrompt || null,
+          novelty_level: noveltyLevel,
+        }),
+        signal: controller.signal,
+      });
+      await readEvents(response, state, onEvent);
+    } catch {
+      // fall through to resuming below
+    }
 
-  fetch(`${API_BASE}/api/generate`, {
-    method: "POST",
-    credentials: "include",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
-      platform,
-      custom_prompt_override: customPrompt || null,
-      novelty_level: noveltyLevel,
-    }),
-    signal: controller.signal,
-  }).then(async (response) => {
-    const reader = response.body?.getReader();
-    if (!reader) return;
-
-    const decoder = new TextDecoder();
-    let buffer = "";
-    let currentEvent = "";
-
-    while (true) {
-      const { done, value } = await reader.read();
-      if (done) break;
-      buffer += decoder.decode(value, { stream: true });
-
-      const lines = buffer.split("\n");
-      buffer = lines.pop() || "";
-
-      for (const line of lines) {
-        if (line.startsWith("event: ")) {
-          currentEvent = line.slice(7).trim();
-        } else if (line.startsWith("data: ") && currentEvent) {
-          try {
-            const data = JSON.parse(line.slice(6));
-            onEvent?.({ type: currentEvent as SSEEvent["type"], data });
-          } catch {
-            // skip malformed data
+    for (let attempt = 0; attempt < RESUME_ATTEMPTS; attempt++) {
+      if (state.finished || !state.jobId || controller.signal.aborted) return;
+      await new Promise((resolve) => setTimeout(resolve, RESUME_DELAY_MS));
+      try {
+        const response = await fetch(
+          `${API_BASE}/api/generate/jobs/${state.jobId}/events`,
+          {
+            credentials: "include",
+            headers: state.lastEventId ? { "Last-Event-ID": state.lastEventId } : {},
+            signal: controller.signal,
           }
-          currentEvent = "";
-        }
+        );
+        if (response.ok) await readEvents(response, state, onEvent);
+      } catch {
+        // retry
       }
     }
-  });
+    if (!state.finished && !controller.signal.aborted) {
+      onEvent?.({ type: "error", data: { message: "Lost connection to the server" } });
+    }
+  };
+  run();
 
   return controller;
 }
 
+export function captchaImageUrl(path: string): string {
+  return `${API_BASE}${path}`;
+}
+
 export async function submitCaptchaSolution(
   coordinates: { x: number; y: number }[]
 ): Promise<{ ok: boolean }> {
@@ -1,7 +1,7 @@
 import { useState, useRef, useCallback } from "react";
 
 interface CaptchaSolverProps {
-  image: string;
+  imageUrl: string;
   prompt: string;
   onSolve: (coordinates: { x: number; y: number }[]) => void;
   submitting: boolean;
@@ -15,7 +15,7 @@ interface Marker {
 }
 
 export default function CaptchaSolver({
-  image,
+  imageUrl,
   prompt,
   onSolve,
   submitting,
@@ -84,7 +84,7 @@ export default function CaptchaSolver({
       <div className="relative inline-block w-full select-none">
         <img
           ref={imgRef}
-          src={`data:image/png;base64,${image}`}
+          src={imageUrl}
           alt="CAPTCHA challenge"
           onLoad={handleImageLoad}
           onClick={handleClick}
@@ -1,7 +1,11 @@
 import { useState, useCallback } from "react";
 import { useLocation, useNavigate } from "react-router-dom";
 import type { TasteProfile, PromptData, SSEEvent } from "../api/client";
-import { startGeneration, submitCaptchaSolution } from "../api/client";
+import {
+  captchaImageUrl,
+  startGeneration,
+  submitCaptchaSolution,
+} from "../api/client";
 import PromptEditor from "../components/PromptEditor";
 import CaptchaSolver from "../components/CaptchaSolver";
 
@@ -25,7 +29,7 @@ export default function Generate() {
   const [progress, setProgress] = useState(0);
   const [error, setError] = useState("");
   const [captchaData, setCaptchaData] = useState<{
-    image: string;
+    imageUrl: string;
     prompt: string;
   } | null>(null);
   const [captchaSubmitting, setCaptchaSubmitting] = useState(false);
@@ -66,6 +70,13 @@ export default function Generate() {
             setProgress(STAGES[s]?.progress || 50);
             break;
           }
+          case "suno_prompt_ready": {
+            if (!editedPrompt) {
+              setEditedPrompt(event.data.suno_prompt as string);
+            }
+            setProgress(30);
+            break;
+          }
           case "prompt_ready": {
             const pd = event.data as unknown as PromptData;
             setPrompts(pd);
@@ -92,7 +103,7 @@ export default function Generate() {
           }
           case "captcha_required": {
             setCaptchaData({
-              image: event.data.image as string,
+              imageUrl: captchaImageUrl(event.data.image_url as string),
               prompt: event.data.prompt as string,
             });
             setStageMessage("Solve the CAPTCHA to continue");
@@ -217,7 +228,8 @@ export default function Generate() {
 
         {captchaData && (
           <CaptchaSolver
-            image={captchaData.image}
+            key={captchaData.imageUrl}
+            imageUrl={captchaData.imageUrl}
             prompt={captchaData.prompt}
             onSolve={handleCaptchaSolve}
             submitting={captchaSubmitting}